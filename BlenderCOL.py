@@ -9,14 +9,13 @@ bl_info = {
     "category": "Import-Export"
 }
 import random
+from array import array
 import bpy
 import bmesh
-import threading
-from enum import Enum
-from btypes.big_endian import *
-from bpy.types import PropertyGroup, Panel, Scene, Operator
+from colformat import (Stats,null_stats,unpack,plan_import,mesh_block,
+    ExportCache,ParseCache,mesh_content_key,rebase_blocks,ExportJob)
+from bpy.types import PropertyGroup, Panel, Operator
 from bpy.utils import register_class, unregister_class
-from bpy.app.handlers import persistent
 from bpy_extras.io_utils import ExportHelper
 from bpy.props import (BoolProperty,
     FloatProperty,
@@ -27,151 +26,63 @@ from bpy.props import (BoolProperty,
     )
 
 
-    
-    
-class Header(Struct):
-    vertex_count = uint32
-    vertex_offset = uint32
-    group_count = uint32
-    group_offset = uint32
-
+def new_collision_material(Key): #create a material holding the given collision values
+    ColType,TerrainType,unknown,ColParameter = Key
+    MaterialName = str(ColType) + "," + str(TerrainType) + "," + str(unknown) + "," + str(ColParameter)
+    mat = bpy.data.materials.new(name=MaterialName)
 
-class Vertex(Struct):
-    x = float32
-    y = float32
-    z = float32
+    random.seed(hash(MaterialName)) #Not actually random
+    Red = random.random()
+    Green = random.random()
+    Blue = random.random()
+    mat.diffuse_color = (Red,Green,Blue)
 
-    def __init__(self,x,y,z):
-        self.x = x
-        self.y = y
-        self.z = z
+    mat.ColEditor.ColType = ColType #Set collision values
+    mat.ColEditor.TerrainType = TerrainType
+    mat.ColEditor.UnknownField = unknown
 
+    if ColParameter is not None:
+        mat.ColEditor.HasColParameterField = True
+        mat.ColEditor.ColParameterField = ColParameter
+    else:
+        mat.ColEditor.HasColParameterField = False
+        mat.ColEditor.ColParameterField = 0
+    return mat
 
-class Group(Struct):
-    CollisionType = uint16 #Properties of collision. e.g. is it water? or what?
-    triangle_count = uint16
-    
-    __padding__ = Padding(1,b'\x00') #Group flags, set them to 0 here
-    has_ColParameter = bool8 #Set 0x0001 to 1 if we have ColParameter values so the game doesn't ignore it
-    __padding__ = Padding(2)#Actual padding
-    vertex_index_offset = uint32
-    TerrainType_offset = uint32 # 0-18,20,21,23,24,27-31
-    unknown_offset = uint32 # 0-27
-    ColParameter_offset = uint32 # 0,1,2,3,4,8,255,6000,7500,7800,8000,8400,9000,10000,10300,12000,14000,17000,19000,20000,21000,22000,27500,30300
-
-
-class Triangle:
-
-    def __init__(self):
-        self.vertex_indices = None
-        self.ColType = 0
-        self.TerrainType = 0
-        self.unknown = 0
-        self.ColParameter = None
-
-    @property
-    def has_ColParameter(self):
-        return self.ColParameter is not None
-
-
-def pack(stream,vertices,triangles): #pack triangles into col file
-    groups = []
-
-    for triangle in triangles:
-        for group in groups: #for each triangle add to appropriate group
-            if triangle.ColType != group.CollisionType: continue #break out of loop to next cycle
-            group.triangles.append(triangle)
-            break
-        else: #if no group has been found
-            group = Group() #create a new group
-            group.CollisionType = triangle.ColType
-            group.has_ColParameter = triangle.has_ColParameter
-            group.triangles = [triangle]
-            groups.append(group) #add to list of groups
-
-    header = Header()
-    header.vertex_count = len(vertices)
-    header.vertex_offset = Header.sizeof() + Group.sizeof()*len(groups)
-    header.group_count = len(groups)
-    header.group_offset = Header.sizeof()
-    Header.pack(stream,header) 
-
-    stream.write(b'\x00'*Group.sizeof()*len(groups))
-
-    for vertex in vertices:
-        Vertex.pack(stream,vertex)
-
-    for group in groups:
-        group.triangle_count = len(group.triangles)
-        group.vertex_index_offset = stream.tell()
-        for triangle in group.triangles:
-            uint16.pack(stream,triangle.vertex_indices[0])
-            uint16.pack(stream,triangle.vertex_indices[1])
-            uint16.pack(stream,triangle.vertex_indices[2])
-
-    for group in groups:
-        group.TerrainType_offset = stream.tell()
-        for triangle in group.triangles:
-            uint8.pack(stream,triangle.TerrainType)
-
-    for group in groups:
-        group.unknown_offset = stream.tell()
-        for triangle in group.triangles:
-            uint8.pack(stream,triangle.unknown)
-
-    for group in groups:
-        if not group.has_ColParameter:
-            group.ColParameter_offset = 0
-        else:
-            group.ColParameter_offset = stream.tell()
-            for triangle in group.triangles:
-                if triangle.ColParameter is not None:
-                    uint16.pack(stream,triangle.ColParameter)
-                else:
-                    uint16.pack(stream,0)
-
-    stream.seek(header.group_offset)
-    for group in groups:
-        Group.pack(stream,group)
-        
-def unpack(stream):
-    header = Header.unpack(stream)
 
-    stream.seek(header.group_offset)
-    groups = [Group.unpack(stream) for _ in range(header.group_count)]
+export_cache = ExportCache()
+parse_cache = ParseCache() #decoded COL files, so importing the same file again skips decoding
 
-    stream.seek(header.vertex_offset)
-    vertices = [Vertex.unpack(stream) for _ in range(header.vertex_count)]
 
-    for group in groups:
-        group.triangles = [Triangle() for _ in range(group.triangle_count)]
-        for triangle in group.triangles:
-            triangle.ColType = group.CollisionType
+def material_keys(Obj): #material_key of each material slot, None for empty slots
+    Materials = []
+    for slot in Obj.material_slots:
+        if slot.material is None:
+            Materials.append(None)
+            continue
+        mat = slot.material.ColEditor
+        Materials.append((mat.ColType,mat.TerrainType,mat.UnknownField,mat.ColParameterField if mat.HasColParameterField else None))
+    return Materials
 
-    for group in groups:
-        stream.seek(group.vertex_index_offset)
-        for triangle in group.triangles:
-            triangle.vertex_indices = [uint16.unpack(stream) for _ in range(3)]
 
-    for group in groups:
-        stream.seek(group.TerrainType_offset)
-        for triangle in group.triangles:
-            triangle.TerrainType = uint8.unpack(stream)
+def object_cache_key(Obj,Scale): #content key of a mesh object, None if the object can not be cached
+    if len(Obj.modifiers) != 0: return None #to_mesh applies modifiers, their result is not in the mesh data
+    Mesh = Obj.data
+    Coordinates = array('f',[0.0])*(3*len(Mesh.vertices))
+    Mesh.vertices.foreach_get("co",Coordinates)
+    LoopVertices = array('i',[0])*len(Mesh.loops)
+    Mesh.loops.foreach_get("vertex_index",LoopVertices)
+    LoopTotals = array('i',[0])*len(Mesh.polygons)
+    Mesh.polygons.foreach_get("loop_total",LoopTotals)
+    MaterialIndices = array('i',[0])*len(Mesh.polygons)
+    Mesh.polygons.foreach_get("material_index",MaterialIndices)
+    return mesh_content_key(Coordinates,LoopVertices,LoopTotals,MaterialIndices,material_keys(Obj),Scale,Obj.matrix_world)
 
-    for group in groups:
-        stream.seek(group.unknown_offset)
-        for triangle in group.triangles:
-            triangle.unknown = uint8.unpack(stream)
 
-    for group in groups:
-        if not group.has_ColParameter: continue
-        stream.seek(group.ColParameter_offset)
-        for triangle in group.triangles:
-            triangle.ColParameter = uint16.unpack(stream)
+def report_stats(operator,stats): #show timings in the operator report and dump them to the console as JSON
+    operator.report({'INFO'},stats.report())
+    print(stats.to_json())
 
-    triangles = sum((group.triangles for group in groups),[])
-
-    return vertices,triangles
 
 class ImportCOL(Operator, ExportHelper): #Operator that exports the collision model into .col file
     """Import a COL file"""
@@ -184,69 +95,50 @@ class ImportCOL(Operator, ExportHelper): #Operator that exports the collision mo
 
     check_extension = True
     filename_ext = ".col" #This is the extension that the model will have
+
+    UseCache = BoolProperty(
+        name="Reuse decoded files",
+        description="Keep recently imported files decoded in memory, importing an unchanged file again skips decoding",
+        default=True,
+    )
+
+    ReportStats = BoolProperty(
+        name="Report timings",
+        description="Time each step and print the timings and counts to the console",
+        default=False,
+    )
+
     def execute(self, context):
-        ColStream = open(self.filepath,'rb')
-        CollisionVertexList = [] #Store a list of verticies
-        Triangles = [] #List of triangles, each containing indicies of verticies
-        CollisionVertexList,Triangles = unpack(ColStream)
+        stats = Stats() if self.ReportStats else null_stats
+        if self.UseCache:
+            CollisionVertexList,Triangles = parse_cache.load(self.filepath,stats) #shared with the cache, only read from them
+        else:
+            with open(self.filepath,'rb') as ColStream:
+                CollisionVertexList,Triangles = unpack(ColStream,stats)
+
+        with stats.phase('plan mesh'):
+            Coordinates,Faces,MaterialKeys,MaterialIndices = plan_import(CollisionVertexList,Triangles)
+        stats.count('faces',len(Faces))
+        stats.count('materials',len(MaterialKeys))
+        if len(Faces) != len(Triangles):
+            self.report({'WARNING'},"Skipped " + str(len(Triangles) - len(Faces)) + " duplicate or invalid triangles")
+
+        with stats.phase('build mesh'):
+            mesh = bpy.data.meshes.new("mesh")  # add a new mesh
+            mesh.from_pydata(Coordinates,[],Faces) #build the whole mesh in one go
+            for Key in MaterialKeys:
+                mesh.materials.append(new_collision_material(Key)) #add material to our mesh
+            mesh.polygons.foreach_set("material_index",MaterialIndices)
+            mesh.update()
 
-            
-        mesh = bpy.data.meshes.new("mesh")  # add a new mesh
         obj = bpy.data.objects.new("CollisionObj", mesh)  # add a new object using the mesh
-
         scene = bpy.context.scene
         scene.objects.link(obj)  # put the object into the scene (link)
         scene.objects.active = obj  # set as the active object in the scene
         obj.select = True  # select object
 
-        mesh = obj.data
-        bm = bmesh.new()
-        BMeshVertexList = []
-        
-        
-        for v in CollisionVertexList:
-            BMeshVertexList.append(bm.verts.new((v.x,-v.z,v.y)))  # add a new vert
-                
-        for f in Triangles:
-            try: #Try and catch to avoid exception on duplicate triangles. Dodgy...
-                MyFace = bm.faces.new((BMeshVertexList[f.vertex_indices[0]],BMeshVertexList[f.vertex_indices[1]],BMeshVertexList[f.vertex_indices[2]]))
-                for i in range(0,len(obj.data.materials)): #Scan materials to find match
-                    mat = obj.data.materials[i]
-                    if f.ColType == mat.ColEditor.ColType and f.TerrainType == mat.ColEditor.TerrainType and f.unknown == mat.ColEditor.UnknownField:#Equate unknowns
-                        ColParameterAreEqual = (f.ColParameter == mat.ColEditor.ColParameterField)
-                        ColParameterDontExist = f.ColParameter is None and mat.ColEditor.HasColParameterField is False #If the ColParameter doesn't exist we need to check for that case
-                        if ColParameterAreEqual or ColParameterDontExist:
-                            MyFace.material_index = i
-                            break #We assigned our material 
-                else: #We did not find a material that matched
-                    MaterialName = str(f.ColType) + "," + str(f.TerrainType) + "," + str(f.unknown) + "," + str(f.ColParameter)
-                    mat = bpy.data.materials.new(name=MaterialName)
-                    
-                    random.seed(hash(MaterialName)) #Not actually random
-                    Red = random.random()
-                    Green = random.random()
-                    Blue = random.random()
-                    mat.diffuse_color = (Red,Green,Blue)
-                    
-                    mat.ColEditor.ColType = f.ColType#Set collision values
-                    mat.ColEditor.TerrainType = f.TerrainType
-                    mat.ColEditor.UnknownField = f.unknown
-                    
-                    if f.ColParameter is not None:
-                        mat.ColEditor.HasColParameterField = True
-                        mat.ColEditor.ColParameterField = f.ColParameter
-                    else:
-                        mat.ColEditor.HasColParameterField = False
-                        mat.ColEditor.ColParameterField = 0 
-                    obj.data.materials.append(mat) #add material to our object
-                    MyFace.material_index = len(obj.data.materials) - 1 #Since material was just added it will be the last index
-            except:
-                continue
-        
-        bm.to_mesh(mesh)
-        mesh.update()
-        bm.free()
-        
+        if self.ReportStats:
+            report_stats(self,stats)
         return{'FINISHED'}
 
 class ExportCOL(Operator, ExportHelper): #Operator that exports the collision model into .col file
@@ -268,43 +160,175 @@ class ExportCOL(Operator, ExportHelper): #Operator that exports the collision mo
         description="Scale the col file by this amount",
         default=1,
     )
+
+    WeldVertices = BoolProperty(
+        name="Weld vertices",
+        description="Merge vertices that are closer together than the weld distance",
+        default=False,
+    )
+
+    WeldDistance = FloatProperty(
+        name="Weld distance",
+        description="Vertices closer than this (after scaling) are merged, 0 merges only exact duplicates",
+        default=0,
+        min=0,
+    )
+
+    MergeCoplanar = BoolProperty(
+        name="Merge coplanar triangles",
+        description="Merge neighbouring triangles that lie in one plane and have the same collision values into fewer, larger triangles",
+        default=False,
+    )
+
+    MergeTolerance = FloatProperty(
+        name="Planarity tolerance",
+        description="How far (after scaling) a vertex may be from the plane of a flat area and still be merged into it",
+        default=0.01,
+        min=0,
+    )
+
+    SpatialOrder = EnumProperty(
+        name="Triangle order",
+        description="Order triangles within each group along a space filling curve for better locality and compression",
+        items=(
+            ('NONE',"Scene order","Keep the order triangles appear in the scene"),
+            ('MORTON',"Morton","Sort along a Z-order curve"),
+            ('HILBERT',"Hilbert","Sort along a Hilbert curve, slower but more coherent"),
+        ),
+        default='NONE',
+    )
+
+    Validate = BoolProperty(
+        name="Validate",
+        description="Check for degenerate, duplicate and out of range triangles before writing",
+        default=True,
+    )
+
+    Yaz0Compress = BoolProperty(
+        name="Yaz0 compress",
+        description="Write the file Yaz0 compressed, ready to go into a game archive",
+        default=False,
+    )
+
+    Yaz0Level = IntProperty(
+        name="Compression level",
+        description="Yaz0 effort level, higher levels give smaller files but take longer",
+        default=6,
+        min=0,
+        max=9,
+    )
+
+    UseCache = BoolProperty(
+        name="Reuse unchanged objects",
+        description="Skip re-extracting objects whose mesh, collision values and scale did not change since the last export",
+        default=True,
+    )
+
+    ReportStats = BoolProperty(
+        name="Report timings",
+        description="Time each step and print the timings and counts to the console",
+        default=False,
+    )
+
+    Background = BoolProperty(
+        name="Export in background",
+        description="Encode and write the file on a worker thread so Blender stays responsive, press Esc to cancel. Only used with a window, scripts and blender --background always export synchronously",
+        default=False,
+    )
 	
     def execute(self, context):        # execute() is called by blender when running the operator.
-        VertexList = [] #Store a list of verticies
-        Triangles = [] #List of triangles, each containing indicies of verticies
-        IndexOffset = 0 #Since each object starts their vertex indicies at 0, we need to shift these indicies once we add elements to the vertex list from various objects
+        stats = Stats() if self.ReportStats else null_stats
+        Blocks = [] #(vertices,triangles) of each object, with indices starting at 0 for each object
         for Obj in bpy.context.scene.objects: #for all objects
             bpy.ops.object.mode_set(mode = 'OBJECT')#Set mode to be object mode
             if Obj.type != 'MESH':
                 continue
-            bm = bmesh.new() #Define new bmesh
+            stats.count('objects',1)
+            Key = None
+            if self.UseCache:
+                with stats.phase('hash'):
+                    Key = object_cache_key(Obj,self.Scale)
+                Block = export_cache.get(Key) if Key is not None else None
+                if Block is not None:
+                    stats.count('cached objects',1)
+                    Blocks.append(Block)
+                    continue
+            Block = self.extract_object(context,Obj,stats)
+            if Key is not None:
+                export_cache.put(Key,Block)
+            Blocks.append(Block)
+
+        with stats.phase('rebase'):
+            VertexList,Triangles = rebase_blocks(Blocks) #Since each object starts their vertex indicies at 0, we need to shift these indicies
+
+        #mesh data can only be read on the main thread, everything after this only needs the vertices and triangles
+        self.job = ExportJob(self.filepath,VertexList,Triangles,
+            weld=self.WeldVertices,
+            weld_distance=self.WeldDistance,
+            merge=self.MergeCoplanar,
+            merge_tolerance=self.MergeTolerance,
+            spatial_order=None if self.SpatialOrder == 'NONE' else self.SpatialOrder.lower(),
+            check=self.Validate,
+            yaz0_level=self.Yaz0Level if self.Yaz0Compress else None,
+            stats=stats)
+
+        if not self.Background or context.window is None: #no window to run a modal handler in, e.g. under blender --background
+            self.job.run()
+            return self.finish_job()            # this lets blender know if the operator finished successfully.
+
+        self.job.start()
+        wm = context.window_manager
+        wm.progress_begin(0,100)
+        self.timer = wm.event_timer_add(0.1,context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event): #polls the export job while it runs on the worker thread
+        if event.type == 'ESC':
+            self.job.cancel()
+        if event.type == 'TIMER':
+            Fraction = self.job.progress()[0]
+            context.window_manager.progress_update(int(Fraction*100))
+            if self.job.done:
+                context.window_manager.event_timer_remove(self.timer)
+                context.window_manager.progress_end()
+                return self.finish_job()
+        return {'PASS_THROUGH'} #keep the rest of the UI responsive
+
+    def finish_job(self): #report the outcome of the export job
+        for Level,Text in self.job.messages:
+            self.report({Level},Text)
+        if self.job.state == 'cancelled':
+            self.report({'WARNING'},"Export cancelled")
+            return {'CANCELLED'}
+        if self.job.state == 'failed':
+            self.report({'ERROR'},self.job.error)
+            return {'CANCELLED'}
+        if self.ReportStats:
+            report_stats(self,self.job.stats)
+        return {'FINISHED'}
+
+    def extract_object(self,context,Obj,stats): #triangulate a mesh object into a (vertices,triangles) block in world space
+        bm = bmesh.new() #Define new bmesh
+        with stats.phase('to_mesh'):
             MyMesh = Obj.to_mesh(context.scene, True, 'PREVIEW')#make a copy of the object we can modify freely
             bm.from_mesh(MyMesh) #Add the above copy into the bmesh
+        with stats.phase('triangulate'):
             bmesh.ops.triangulate(bm, faces=bm.faces[:], quad_method=0, ngon_method=0) #triangulate bmesh
-
-            for Vert in bm.verts:
-                VertexList.append(Vertex(Vert.co.x*self.Scale,Vert.co.z*self.Scale,-Vert.co.y*self.Scale)) #add in verts, make sure y is up
-
-            for Face in bm.faces:
-                MyTriangle = Triangle()
-                MyTriangle.vertex_indices = [Face.verts[0].index + IndexOffset,Face.verts[1].index + IndexOffset,Face.verts[2].index + IndexOffset] #add three vertex indicies
-
-                slot = Obj.material_slots[Face.material_index]
-                mat = slot.material.ColEditor
-                if mat is not None:
-                    MyTriangle.ColType = mat.ColType
-                    MyTriangle.TerrainType = mat.TerrainType
-                    MyTriangle.unknown = mat.UnknownField
-                    if mat.HasColParameterField == True:
-                        MyTriangle.ColParameter = mat.ColParameterField
-                Triangles.append(MyTriangle) #add triangles
-            bm.free()
-            del bm
-            IndexOffset = len(VertexList)#set offset
-
-        ColStream = open(self.filepath,'wb')
-        pack(ColStream,VertexList,Triangles)
-        return {'FINISHED'}            # this lets blender know the operator finished successfully.
+            bm.to_mesh(MyMesh) #write the triangles back so they can be read in bulk, every polygon now has three loops
+        bm.free()
+        del bm
+
+        with stats.phase('collect'):
+            Coordinates = array('f',[0.0])*(3*len(MyMesh.vertices))
+            MyMesh.vertices.foreach_get("co",Coordinates)
+            TriangleVertices = array('i',[0])*len(MyMesh.loops)
+            MyMesh.loops.foreach_get("vertex_index",TriangleVertices)
+            MaterialIndices = array('i',[0])*len(MyMesh.polygons)
+            MyMesh.polygons.foreach_get("material_index",MaterialIndices)
+            Block = mesh_block(Coordinates,TriangleVertices,MaterialIndices,material_keys(Obj),Obj.matrix_world,self.Scale)
+        bpy.data.meshes.remove(MyMesh) #the copy is not needed anymore
+        return Block
 
 class CollisionProperties(PropertyGroup): #This defines the UI elements
     ColType = IntProperty(name = "Collision type",default=0, min=0, max=65535) #Here we put parameters for the UI elements and point to the Update functions
@@ -373,4 +397,4 @@ def unregister():
 # This allows you to run the script directly from blenders text editor
 # to test the addon without having to install it.
 if __name__ == "__main__":
-    register()
\ No newline at end of file
+    register()
@@ -0,0 +1,276 @@
+"""Benchmarks for the COL codec, Yaz0 compression and the btypes primitives.
+
+Runs without Blender. Meshes are generated from a fixed seed so results can be
+compared between versions, e.g.
+
+    python benchmark.py --triangles 1000 10000 100000 --output results.json
+"""
+
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import colformat
+
+
+def generate_mesh(triangle_count,collision_types=8,ColParameter_density=0.1,seed=0):
+    """Return (vertices,triangles) for a seeded synthetic stage.
+
+    Vertices lie on a noisy height field and triangles connect neighbouring
+    vertices, so indices are spatially local like in a real stage. The vertex
+    count stays within the uint16 index limit of the format.
+    """
+    rng = random.Random(seed)
+    vertex_count = max(3,min(65535,triangle_count//2 + 2))
+    width = max(2,int(vertex_count**0.5))
+    vertices = [colformat.Vertex((i % width)*100.0,rng.uniform(-50.0,50.0),(i//width)*100.0) for i in range(vertex_count)]
+
+    ColTypes = [0] + rng.sample(range(1,0x1000),collision_types - 1) if collision_types > 1 else [0]
+    with_ColParameter = set(ColType for ColType in ColTypes if rng.random() < ColParameter_density)
+    triangles = []
+    for _ in range(triangle_count):
+        i = rng.randrange(vertex_count - width - 1)
+        triangle = colformat.Triangle()
+        triangle.vertex_indices = [i,i + 1,i + width] if rng.random() < 0.5 else [i + 1,i + width + 1,i + width]
+        triangle.ColType = rng.choice(ColTypes)
+        triangle.TerrainType = rng.randrange(32)
+        triangle.unknown = rng.randrange(28)
+        if triangle.ColType in with_ColParameter:
+            triangle.ColParameter = rng.randrange(65536)
+        triangles.append(triangle)
+    return vertices,triangles
+
+
+def measure(function,repeat):
+    """Run function repeat times, returns (best seconds, peak traced bytes, last result)."""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best,elapsed)
+    gc.collect()
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best,peak,result
+
+
+def retained(function):
+    """Run function once, returns (traced bytes still allocated while its result is kept, result)."""
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return current,result
+
+
+def record(results,name,triangle_count,seconds,peak,bytes_written=None,items=None):
+    entry = {
+        'name':name,
+        'triangles':triangle_count,
+        'seconds':seconds,
+        'peak_memory':peak,
+    }
+    if triangle_count:
+        entry['triangles_per_second'] = triangle_count/seconds if seconds else None
+    if items is not None:
+        entry['items'] = items
+        entry['items_per_second'] = items/seconds if seconds else None
+    if bytes_written is not None:
+        entry['bytes'] = bytes_written
+    results.append(entry)
+    print('{:<28}{:>10}  {:>10.4f}s  {:>12} B peak'.format(name,triangle_count or items,seconds,peak),flush=True)
+
+
+def benchmark_codec(results,triangle_count,args):
+    vertices,triangles = generate_mesh(triangle_count,args.collision_types,args.ColParameter_density,args.seed)
+
+    def run_pack():
+        stream = io.BytesIO()
+        colformat.pack(stream,vertices,triangles)
+        return stream.getvalue()
+    seconds,peak,data = measure(run_pack,args.repeat)
+    record(results,'pack',triangle_count,seconds,peak,len(data))
+
+    seconds,peak,_ = measure(lambda: colformat.unpack(io.BytesIO(data)),args.repeat)
+    record(results,'unpack',triangle_count,seconds,peak,len(data))
+
+    def run_writer():
+        stream = io.BytesIO()
+        writer = colformat.COLWriter(stream)
+        writer.add_vertices(vertices)
+        writer.add_triangles(triangles)
+        writer.finish()
+        return stream.getvalue()
+    seconds,peak,_ = measure(run_writer,args.repeat)
+    record(results,'COLWriter',triangle_count,seconds,peak,len(data))
+
+    try:
+        import numpy
+    except ImportError:
+        return
+    arrays = colformat.COLArrays.from_objects(vertices,triangles)
+
+    def run_pack_arrays():
+        stream = io.BytesIO()
+        colformat.pack_arrays(stream,arrays)
+        return stream.getvalue()
+    seconds,peak,_ = measure(run_pack_arrays,args.repeat)
+    record(results,'pack_arrays',triangle_count,seconds,peak,len(data))
+
+    seconds,peak,_ = measure(lambda: colformat.unpack_arrays(io.BytesIO(data)),args.repeat)
+    record(results,'unpack_arrays',triangle_count,seconds,peak,len(data))
+
+
+def benchmark_yaz0(results,triangle_count,args): #throughput in bytes per second of uncompressed data is items_per_second
+    vertices,triangles = generate_mesh(triangle_count,args.collision_types,args.ColParameter_density,args.seed)
+    stream = io.BytesIO()
+    colformat.pack(stream,vertices,triangles)
+    data = stream.getvalue()
+
+    for level in args.yaz0_levels:
+        seconds,peak,compressed = measure(lambda: colformat.yaz0.compress(data,level),args.repeat)
+        record(results,'yaz0.compress level {}'.format(level),triangle_count,seconds,peak,len(compressed),len(data))
+        results[-1]['ratio'] = len(compressed)/len(data)
+
+        seconds,peak,_ = measure(lambda: colformat.yaz0.decompress(compressed),args.repeat)
+        record(results,'yaz0.decompress level {}'.format(level),triangle_count,seconds,peak,len(compressed),len(data))
+
+        seconds,peak,_ = measure(lambda: colformat.unpack(io.BytesIO(compressed)),args.repeat)
+        record(results,'unpack yaz0 level {}'.format(level),triangle_count,seconds,peak,len(compressed))
+
+
+def benchmark_tables(results,triangle_count,args): #memory held by the decoded mesh as objects and as tables, in 'retained_memory'
+    vertices,triangles = generate_mesh(triangle_count,args.collision_types,args.ColParameter_density,args.seed)
+    stream = io.BytesIO()
+    colformat.pack(stream,vertices,triangles)
+    data = stream.getvalue()
+    del vertices,triangles
+
+    for name,tables in (('objects',False),('tables',True)):
+        seconds,peak,_ = measure(lambda: colformat.unpack(io.BytesIO(data),tables=tables),args.repeat)
+        record(results,'unpack ' + name,triangle_count,seconds,peak,len(data))
+        memory,(vertices,triangles) = retained(lambda: colformat.unpack(io.BytesIO(data),tables=tables))
+        results[-1]['retained_memory'] = memory
+        print('{:<28}{:>10}  {:>12} B retained'.format('  ' + name,triangle_count,memory),flush=True)
+
+        seconds,peak,_ = measure(lambda: colformat.pack(io.BytesIO(),vertices,triangles),args.repeat)
+        record(results,'pack ' + name,triangle_count,seconds,peak,len(data))
+        vertices = triangles = None
+
+
+def benchmark_btypes(results,count,args):
+    from btypes.big_endian import uint8,uint16,float32
+    values = [i % 65536 for i in range(count)]
+    vertices = [colformat.Vertex(float(i),float(i),float(i)) for i in range(count)]
+    group = colformat.Group()
+    group.CollisionType,group.triangle_count,group.has_ColParameter = 1,2,True
+    group.vertex_index_offset = group.TerrainType_offset = group.unknown_offset = group.ColParameter_offset = 0
+
+    def loop_pack(field_type,items):
+        def run():
+            stream = io.BytesIO()
+            for item in items: field_type.pack(stream,item)
+            return stream.getvalue()
+        return run
+
+    def loop_unpack(field_type,data):
+        def run():
+            stream = io.BytesIO(data)
+            return [field_type.unpack(stream) for _ in range(count)]
+        return run
+
+    def many_pack(field_type,items):
+        def run():
+            stream = io.BytesIO()
+            field_type.pack_many(stream,items)
+            return stream.getvalue()
+        return run
+
+    def many_unpack(field_type,data):
+        return lambda: field_type.unpack_many(io.BytesIO(data),count)
+
+    cases = (
+        ('uint8',uint8,[value % 256 for value in values]),
+        ('uint16',uint16,values),
+        ('float32',float32,[float(value) for value in values]),
+        ('Vertex',colformat.Vertex,vertices),
+        ('Group',colformat.Group,[group]*count),
+    )
+    for name,field_type,items in cases:
+        seconds,peak,data = measure(loop_pack(field_type,items),args.repeat)
+        record(results,name + '.pack',0,seconds,peak,len(data),count)
+        seconds,peak,_ = measure(loop_unpack(field_type,data),args.repeat)
+        record(results,name + '.unpack',0,seconds,peak,len(data),count)
+        seconds,peak,_ = measure(many_pack(field_type,items),args.repeat)
+        record(results,name + '.pack_many',0,seconds,peak,len(data),count)
+        seconds,peak,_ = measure(many_unpack(field_type,data),args.repeat)
+        record(results,name + '.unpack_many',0,seconds,peak,len(data),count)
+
+
+def benchmark_import(results,args):
+    """Time importing the core package and the add-on, each in a fresh interpreter."""
+    script = 'import time; start = time.perf_counter(); import {}; print(time.perf_counter() - start)'
+    for module in ('colformat','BlenderCOL'):
+        best = None
+        for _ in range(args.repeat):
+            process = subprocess.run([sys.executable,'-c',script.format(module)],capture_output=True,text=True,cwd=os.path.dirname(os.path.abspath(__file__)))
+            if process.returncode != 0: break #BlenderCOL needs bpy, only measurable inside Blender
+            seconds = float(process.stdout)
+            best = seconds if best is None else min(best,seconds)
+        if best is None:
+            results.append({'name':'import ' + module,'skipped':process.stderr.strip().splitlines()[-1]})
+            print('{:<28}{:>10}'.format('import ' + module,'skipped'),flush=True)
+        else:
+            record(results,'import ' + module,0,best,0,items=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--triangles',type=int,nargs='+',default=[1000,10000,100000,1000000],help='triangle counts of the generated meshes')
+    parser.add_argument('--collision-types',dest='collision_types',type=int,default=8,help='number of distinct ColType values')
+    parser.add_argument('--colparameter-density',dest='ColParameter_density',type=float,default=0.25,help='fraction of collision types that carry a ColParameter')
+    parser.add_argument('--btypes-count',dest='btypes_count',type=int,default=100000,help='number of values for the btypes benchmarks, 0 to skip')
+    parser.add_argument('--repeat',type=int,default=3,help='timed runs per benchmark, the best one is reported')
+    parser.add_argument('--yaz0-levels',dest='yaz0_levels',type=int,nargs='*',default=[1,6],help='Yaz0 effort levels to benchmark, none to skip')
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--output',help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    results = []
+    benchmark_import(results,args)
+    if args.btypes_count:
+        benchmark_btypes(results,args.btypes_count,args)
+    for triangle_count in args.triangles:
+        benchmark_codec(results,triangle_count,args)
+        benchmark_tables(results,triangle_count,args)
+        benchmark_yaz0(results,triangle_count,args)
+
+    report = {
+        'version':colformat.__version__,
+        'python':sys.version.split()[0],
+        'platform':platform.platform(),
+        'parameters':vars(args),
+        'results':results,
+    }
+    if args.output:
+        with open(args.output,'w') as stream:
+            json.dump(report,stream,indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
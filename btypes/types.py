@@ -1,4 +1,109 @@
+import io as _io
 import struct as _struct
+import sys as _sys
+from array import array as _array
+from operator import attrgetter as _attrgetter
+
+
+_NATIVE_ENDIANESS = '<' if _sys.byteorder == 'little' else '>'
+
+
+def _array_typecode(format_character,size):
+    if format_character in 'bhilq':
+        typecodes = 'bhilq'
+    elif format_character in 'BHILQ':
+        typecodes = 'BHILQ'
+    elif format_character in 'fd':
+        typecodes = format_character
+    else:
+        return None
+    for typecode in typecodes:
+        if _array(typecode).itemsize == size:
+            return typecode
+    return None
+
+
+def _pack_many(field_type,stream,values):
+    if hasattr(field_type,'pack_many'):
+        field_type.pack_many(stream,values)
+    else:
+        for value in values:
+            field_type.pack(stream,value)
+
+
+def _unpack_many(field_type,stream,count):
+    if hasattr(field_type,'unpack_many'):
+        return field_type.unpack_many(stream,count)
+    return [field_type.unpack(stream) for i in range(count)]
+
+
+def _unpack_many_from(field_type,buffer,offset,count):
+    if hasattr(field_type,'unpack_many_from'):
+        return field_type.unpack_many_from(buffer,offset,count)
+    values = []
+    for i in range(count):
+        value,offset = field_type.decode_from(buffer,offset)
+        values.append(value)
+    return values
+
+
+def _find(buffer,sub,start,step): #first occurrence of sub at start + k*step, or -1
+    if hasattr(buffer,'find'):
+        index = buffer.find(sub,start)
+        while index != -1 and (index - start) % step:
+            index = buffer.find(sub,index + 1)
+        return index
+    #memoryview has no find, search copies of growing chunks so long buffers are not copied whole
+    chunk_size = 64*step
+    position = start
+    while position < len(buffer):
+        index = _find(bytes(buffer[position:position + chunk_size]),sub,0,step)
+        if index != -1: return position + index
+        position += chunk_size
+        chunk_size *= 2
+    return -1
+
+
+class Cursor:
+    """Read position in a buffer.
+
+    Decodes values one after another straight from the buffer with
+    decode_from, without copying the data into intermediate bytes objects.
+    read, seek and tell make it usable as a stream by code written against
+    the stream API.
+    """
+
+    def __init__(self,buffer,offset=0):
+        self.buffer = buffer
+        self.offset = offset
+
+    def unpack(self,field_type):
+        value,self.offset = field_type.decode_from(self.buffer,self.offset)
+        return value
+
+    def unpack_many(self,field_type,count):
+        size = field_type.sizeof()
+        if size is None: #variable size values, only decoding them finds the end
+            return [self.unpack(field_type) for i in range(count)]
+        values = _unpack_many_from(field_type,self.buffer,self.offset,count)
+        self.offset += count*size
+        return values
+
+    def read(self,size=-1):
+        end = len(self.buffer) if size is None or size < 0 else min(self.offset + size,len(self.buffer))
+        data = self.buffer[self.offset:end]
+        self.offset = end
+        return data
+
+    def seek(self,offset,whence=0):
+        self.offset = offset if whence == 0 else self.offset + offset if whence == 1 else len(self.buffer) + offset
+        return self.offset
+
+    def tell(self):
+        return self.offset
+
+    def seekable(self):
+        return True
 
 
 class BasicType:
@@ -7,13 +112,55 @@ class BasicType:
         self.format_character = format_character
         self.endianess = endianess
         self.format_string = endianess + format_character
-        self.size = _struct.calcsize(self.format_string)
+        self.struct = _struct.Struct(self.format_string)
+        self.size = self.struct.size
+        self.array_typecode = _array_typecode(format_character,self.size)
+        self.byteswap = endianess in '>!' if _NATIVE_ENDIANESS == '<' else endianess == '<'
 
     def pack(self,stream,value):
         stream.write(_struct.pack(self.format_string,value))
 
     def unpack(self,stream):
-        return _struct.unpack(self.format_string,stream.read(self.size))[0]
+        return self.struct.unpack(stream.read(self.size))[0]
+
+    def unpack_from(self,buffer,offset=0):
+        return self.struct.unpack_from(buffer,offset)[0]
+
+    def decode_from(self,buffer,offset):
+        return self.struct.unpack_from(buffer,offset)[0],offset + self.size
+
+    def pack_into(self,buffer,offset,value):
+        _struct.pack_into(self.format_string,buffer,offset,value)
+
+    def encode_many(self,values):
+        if self.array_typecode is not None:
+            data = _array(self.array_typecode,values)
+            if self.byteswap: data.byteswap()
+            return data.tobytes()
+        values = list(values)
+        return _struct.pack('{}{}{}'.format(self.endianess,len(values),self.format_character),*values)
+
+    def pack_many(self,stream,values):
+        stream.write(self.encode_many(values))
+
+    def pack_many_into(self,buffer,offset,values):
+        data = self.encode_many(values)
+        buffer[offset:offset + len(data)] = data
+        return len(data)
+
+    def unpack_many(self,stream,count):
+        return self.unpack_many_from(stream.read(count*self.size),0,count)
+
+    def unpack_many_from(self,buffer,offset,count):
+        with memoryview(buffer) as view,view[offset:offset + count*self.size] as data:
+            if len(data) != count*self.size:
+                raise _struct.error('unpack_many requires a buffer of {} bytes'.format(count*self.size))
+            if self.array_typecode is not None:
+                values = _array(self.array_typecode)
+                values.frombytes(data)
+                if self.byteswap: values.byteswap()
+                return values.tolist()
+            return list(_struct.unpack('{}{}{}'.format(self.endianess,count,self.format_character),data))
 
     def sizeof(self):
         return self.size
@@ -31,6 +178,13 @@ class FixedPointConverter:
     def unpack(self,stream):
         return self.integer_type.unpack(stream)*self.scale
 
+    def unpack_from(self,buffer,offset=0):
+        return self.decode_from(buffer,offset)[0]
+
+    def decode_from(self,buffer,offset):
+        value,offset = self.integer_type.decode_from(buffer,offset)
+        return value*self.scale,offset
+
     def sizeof(self):
         return self.integer_type.sizeof()
 
@@ -46,7 +200,16 @@ class ByteString:
         stream.write(string)
 
     def unpack(self,stream):
-        return stream.read(self.length)
+        return bytes(stream.read(self.length))
+
+    def unpack_from(self,buffer,offset=0):
+        return self.decode_from(buffer,offset)[0]
+
+    def decode_from(self,buffer,offset):
+        string = bytes(buffer[offset:offset + self.length])
+        if len(string) != self.length:
+            raise _struct.error('unpack requires a buffer of {} bytes'.format(self.length))
+        return string,offset + self.length
 
     def sizeof(self):
         return self.length
@@ -67,6 +230,34 @@ class Array:
     def unpack(self,stream):
         return [self.element_type.unpack(stream) for i in range(self.length)]
 
+    def unpack_from(self,buffer,offset=0):
+        return self.decode_from(buffer,offset)[0]
+
+    def decode_from(self,buffer,offset):
+        array = []
+        for i in range(self.length):
+            value,offset = self.element_type.decode_from(buffer,offset)
+            array.append(value)
+        return array,offset
+
+    def pack_many(self,stream,arrays):
+        values = []
+        for array in arrays:
+            if len(array) != self.length:
+                raise ValueError('wrong array length')
+            values.extend(array)
+        _pack_many(self.element_type,stream,values)
+
+    def unpack_many(self,stream,count):
+        values = _unpack_many(self.element_type,stream,count*self.length)
+        length = self.length
+        return [values[i:i + length] for i in range(0,count*length,length)]
+
+    def unpack_many_from(self,buffer,offset,count):
+        values = _unpack_many_from(self.element_type,buffer,offset,count*self.length)
+        length = self.length
+        return [values[i:i + length] for i in range(0,count*length,length)]
+
     def sizeof(self):
         return self.length*self.element_type.sizeof()
 
@@ -75,19 +266,36 @@ class CString:
 
     def __init__(self,encoding):
         self.encoding = encoding
+        self.null = '\0'.encode(encoding) #XXX: This might not work for all encodings
 
     def pack(self,stream,string):
         stream.write((string + '\0').encode(self.encoding))
 
     def unpack(self,stream):
-        #XXX: This might not work for all encodings
-        null = '\0'.encode(self.encoding)
-        string = b''
+        null = self.null
+        seekable = getattr(stream,'seekable',lambda: False)()
+        chunk_size = 64*len(null) if seekable else len(null) #can only read past the terminator when we can seek back
+        string = bytearray()
         while True:
-            c = stream.read(len(null))
-            if c == null: break
-            string += c
-        return string.decode(self.encoding)
+            chunk = stream.read(chunk_size)
+            index = _find(chunk,null,0,len(null))
+            if index != -1:
+                string += chunk[:index]
+                if seekable: stream.seek(index + len(null) - len(chunk),1)
+                return str(string,self.encoding)
+            if len(chunk) < chunk_size:
+                raise _struct.error('unterminated string')
+            string += chunk
+            if seekable: chunk_size = min(2*chunk_size,4096)
+
+    def unpack_from(self,buffer,offset=0):
+        return self.decode_from(buffer,offset)[0]
+
+    def decode_from(self,buffer,offset):
+        end = _find(buffer,self.null,offset,len(self.null))
+        if end == -1:
+            raise _struct.error('unterminated string')
+        return str(buffer[offset:end],self.encoding),end + len(self.null)
 
     def sizeof(self):
         return None
@@ -106,7 +314,17 @@ class PString:
 
     def unpack(self,stream):
         length = self.length_type.unpack(stream)
-        return stream.read(length).decode(self.encoding)
+        return str(stream.read(length),self.encoding)
+
+    def unpack_from(self,buffer,offset=0):
+        return self.decode_from(buffer,offset)[0]
+
+    def decode_from(self,buffer,offset):
+        length,offset = self.length_type.decode_from(buffer,offset)
+        string = buffer[offset:offset + length]
+        if len(string) != length:
+            raise _struct.error('unpack requires a buffer of {} bytes'.format(length))
+        return str(string,self.encoding),offset + length
 
     def sizeof(self):
         return None
@@ -124,6 +342,11 @@ class Field:
     def unpack(self,stream,struct):
         setattr(struct,self.name,self.field_type.unpack(stream))
 
+    def decode_from(self,buffer,offset,struct):
+        value,offset = self.field_type.decode_from(buffer,offset)
+        setattr(struct,self.name,value)
+        return offset
+
     def sizeof(self):
         return self.field_type.sizeof()
 
@@ -143,6 +366,9 @@ class Padding:
     def unpack(self,stream,struct):
         stream.read(self.length)
 
+    def decode_from(self,buffer,offset,struct):
+        return offset + self.length
+
     def sizeof(self):
         return self.length
 
@@ -165,6 +391,112 @@ class StructClassDictionary(dict):
             super().__setitem__(key,value)
 
 
+class StructCodec:
+    """Single struct.Struct encoding of all the fields of a fixed-size struct.
+
+    Padding is folded into the format. Zero padding becomes 'x' bytes, other
+    padding is written as a constant 's' field and skipped as 'x' bytes when
+    unpacking.
+    """
+
+    def __init__(self,endianess,items):
+        self.names = []
+        self.arrays = []
+        self.constants = []
+        value_count = 0
+        pack_format = endianess
+        unpack_format = endianess
+        for kind,*args in items:
+            if kind == 'padding':
+                length,padding = args
+                unpack_format += '{}x'.format(length)
+                if padding.count(0) == length:
+                    pack_format += '{}x'.format(length)
+                else:
+                    self.constants.append((value_count,padding))
+                    value_count += 1
+                    pack_format += '{}s'.format(length)
+            elif kind == 'array':
+                name,format_character,length = args
+                self.arrays.append((len(self.names),length))
+                self.names.append(name)
+                value_count += length
+                pack_format += '{}{}'.format(length,format_character)
+                unpack_format += '{}{}'.format(length,format_character)
+            else:
+                name,format_character = args
+                self.names.append(name)
+                value_count += 1
+                pack_format += format_character
+                unpack_format += format_character
+
+        self.pack_struct = _struct.Struct(pack_format)
+        self.unpack_struct = _struct.Struct(unpack_format)
+        self.size = self.unpack_struct.size
+        self.getter = _attrgetter(*self.names) if self.names else (lambda struct: ())
+        if len(self.names) == 1:
+            getter = self.getter
+            self.getter = lambda struct: (getter(struct),)
+        self.use_dict = False
+
+    @staticmethod
+    def compile(struct_fields):
+        """Return a StructCodec for the given fields, or None if they cannot be
+        expressed as a single struct format."""
+        endianesses = set()
+        items = []
+        for field in struct_fields:
+            if isinstance(field,Padding):
+                items.append(('padding',field.length,field.padding*field.length))
+                continue
+            if not isinstance(field,Field):
+                return None
+            field_type = field.field_type
+            if isinstance(field_type,BasicType):
+                endianesses.add(field_type.endianess)
+                items.append(('value',field.name,field_type.format_character))
+            elif isinstance(field_type,Array) and isinstance(field_type.element_type,BasicType):
+                endianesses.add(field_type.element_type.endianess)
+                items.append(('array',field.name,field_type.element_type.format_character,field_type.length))
+            else:
+                return None
+
+        if len(endianesses) > 1: return None
+        endianess = endianesses.pop() if endianesses else '<'
+        if endianess not in '<>!=': return None #native alignment would change the layout
+        return StructCodec(endianess,items)
+
+    def values(self,struct):
+        values = self.getter(struct)
+        if self.arrays:
+            values = list(values)
+            for index,length in reversed(self.arrays):
+                if len(values[index]) != length:
+                    raise ValueError('wrong array length')
+                values[index:index + 1] = values[index]
+            values = tuple(values)
+        for index,constant in self.constants:
+            values = values[:index] + (constant,) + values[index:]
+        return values
+
+    def pack(self,struct):
+        return self.pack_struct.pack(*self.values(struct))
+
+    def pack_into(self,buffer,offset,struct):
+        self.pack_struct.pack_into(buffer,offset,*self.values(struct))
+
+    def assign(self,struct,values):
+        if self.arrays:
+            values = list(values)
+            for index,length in self.arrays:
+                values[index:index + length] = [values[index:index + length]]
+        if self.use_dict:
+            struct.__dict__.update(zip(self.names,values))
+        else:
+            for name,value in zip(self.names,values):
+                setattr(struct,name,value)
+
+
 class StructMetaClass(type):
 
     @classmethod
@@ -174,12 +506,17 @@ class StructMetaClass(type):
     def __new__(metacls,cls,bases,classdict):
         if any(field.sizeof() is None for field in classdict.struct_fields):
             struct_size = None
+            struct_codec = None
         else:
             struct_size = sum(field.sizeof() for field in classdict.struct_fields)
+            struct_codec = StructCodec.compile(classdict.struct_fields)
 
         struct_class = type.__new__(metacls,cls,bases,classdict)
         struct_class.struct_fields = classdict.struct_fields
         struct_class.struct_size = struct_size
+        struct_class.struct_codec = struct_codec
+        if struct_codec is not None:
+            struct_codec.use_dict = struct_class.__dictoffset__ != 0
         return struct_class
 
     def __init__(self,cls,bases,classdict):
@@ -195,17 +532,98 @@ class Struct(metaclass=StructMetaClass):
 
     @classmethod
     def pack(cls,stream,struct):
+        if cls.struct_codec is not None:
+            stream.write(cls.struct_codec.pack(struct))
+            return
         for field in cls.struct_fields:
             field.pack(stream,struct)
 
     @classmethod
     def unpack(cls,stream):
         struct = cls.__new__(cls) #TODO: what if __init__ does something important?
+        codec = cls.struct_codec
+        if codec is not None:
+            codec.assign(struct,codec.unpack_struct.unpack(stream.read(codec.size)))
+            return struct
         for field in cls.struct_fields:
             field.unpack(stream,struct)
         return struct
 
+    @classmethod
+    def pack_many(cls,stream,structs):
+        codec = cls.struct_codec
+        if codec is not None:
+            stream.write(b''.join([codec.pack(struct) for struct in structs]))
+            return
+        for struct in structs:
+            cls.pack(stream,struct)
+
+    @classmethod
+    def pack_many_into(cls,buffer,offset,structs):
+        codec = cls.struct_codec
+        if codec is None:
+            stream = _io.BytesIO()
+            cls.pack_many(stream,structs)
+            data = stream.getvalue()
+            buffer[offset:offset + len(data)] = data
+            return len(data)
+        start = offset
+        for struct in structs:
+            codec.pack_into(buffer,offset,struct)
+            offset += codec.size
+        return offset - start
+
+    @classmethod
+    def unpack_many(cls,stream,count):
+        codec = cls.struct_codec
+        if codec is None:
+            return [cls.unpack(stream) for i in range(count)]
+        return cls.unpack_many_from(stream.read(count*codec.size),0,count)
+
+    @classmethod
+    def unpack_many_from(cls,buffer,offset,count):
+        codec = cls.struct_codec
+        if codec is None:
+            structs = []
+            for i in range(count):
+                struct,offset = cls.decode_from(buffer,offset)
+                structs.append(struct)
+            return structs
+        with memoryview(buffer) as view,view[offset:offset + count*codec.size] as data:
+            if len(data) != count*codec.size:
+                raise _struct.error('unpack_many requires a buffer of {} bytes'.format(count*codec.size))
+            structs = []
+            for values in codec.unpack_struct.iter_unpack(data):
+                struct = cls.__new__(cls)
+                codec.assign(struct,values)
+                structs.append(struct)
+        return structs
+
+    @classmethod
+    def pack_into(cls,buffer,offset,struct):
+        if cls.struct_codec is not None:
+            cls.struct_codec.pack_into(buffer,offset,struct)
+            return
+        stream = _io.BytesIO()
+        cls.pack(stream,struct)
+        data = stream.getvalue()
+        buffer[offset:offset + len(data)] = data
+
+    @classmethod
+    def unpack_from(cls,buffer,offset=0):
+        return cls.decode_from(buffer,offset)[0]
+
+    @classmethod
+    def decode_from(cls,buffer,offset):
+        struct = cls.__new__(cls)
+        codec = cls.struct_codec
+        if codec is not None:
+            codec.assign(struct,codec.unpack_struct.unpack_from(buffer,offset))
+            return struct,offset + codec.size
+        for field in cls.struct_fields:
+            offset = field.decode_from(buffer,offset,struct)
+        return struct,offset
+
     @classmethod
     def sizeof(cls):
         return cls.struct_size
-
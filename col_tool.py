@@ -0,0 +1,183 @@
+"""Command line tool for batch converting and inspecting COL files without Blender.
+
+    python col_tool.py obj2col stage/*.obj --output-dir build/
+    python col_tool.py col2obj build/ --jobs 4
+    python col_tool.py recode build/**/*.col
+    python col_tool.py recode build/ --yaz0 --output-dir archive/
+    python col_tool.py info build/
+    python col_tool.py diff old.col new.col --tolerance 0.01
+
+OBJ materials carry the collision values in their name, as
+ColType,TerrainType,unknown,ColParameter (ColParameter may be None). This is
+the same naming ImportCOL uses for the materials it creates. Yaz0 compressed
+COL files are read like plain ones, --yaz0 compresses what obj2col and
+recode write.
+"""
+
+import argparse
+import glob
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor,as_completed
+
+import colformat
+
+
+def parse_material_name(name): #collision values from a material name, unknown names give default values
+    parts = name.split(',')
+    if len(parts) != 4: return (0,0,0,None)
+    try:
+        ColType,TerrainType,unknown = int(parts[0]),int(parts[1]),int(parts[2])
+        ColParameter = None if parts[3] == 'None' else int(parts[3])
+    except ValueError:
+        return (0,0,0,None)
+    return (ColType,TerrainType,unknown,ColParameter)
+
+
+def read_obj(stream,scale=1.0):
+    vertices = []
+    triangles = []
+    material = (0,0,0,None)
+    for line in stream:
+        fields = line.split()
+        if not fields: continue
+        if fields[0] == 'v':
+            vertices.append(colformat.Vertex(float(fields[1])*scale,float(fields[2])*scale,float(fields[3])*scale))
+        elif fields[0] == 'usemtl':
+            material = parse_material_name(line.strip()[len('usemtl'):].strip())
+        elif fields[0] == 'f':
+            indices = []
+            for field in fields[1:]:
+                index = int(field.split('/')[0])
+                indices.append(index - 1 if index > 0 else len(vertices) + index)
+            for i in range(1,len(indices) - 1): #fan triangulation of polygons
+                triangle = colformat.Triangle()
+                triangle.vertex_indices = [indices[0],indices[i],indices[i + 1]]
+                triangle.ColType,triangle.TerrainType,triangle.unknown,triangle.ColParameter = material
+                triangles.append(triangle)
+    return vertices,triangles
+
+
+def write_obj(stream,vertices,triangles):
+    for vertex in vertices:
+        stream.write('v {!r} {!r} {!r}\n'.format(vertex.x,vertex.y,vertex.z))
+    material = None
+    for triangle in triangles:
+        key = colformat.material_key(triangle)
+        if key != material:
+            material = key
+            stream.write('usemtl {},{},{},{}\n'.format(*key))
+        stream.write('f {} {} {}\n'.format(*(index + 1 for index in triangle.vertex_indices)))
+
+
+def describe(path):
+    with colformat.COLView.open(path) as view:
+        lines = ['{}: {} vertices, {} triangles, {} groups'.format(path,len(view.vertices),len(view.triangles),len(view.groups))]
+        for i,group in enumerate(view.groups):
+            lines.append('  group {}: ColType {}, {} triangles{}'.format(
+                i,group.CollisionType,len(group),', has ColParameter' if group.has_ColParameter else ''))
+    return '\n'.join(lines)
+
+
+def diff_files(old_path,new_path,tolerance): #print the differences, returns 1 if the files differ like diff(1)
+    with colformat.COLView.open(old_path) as old_view,colformat.COLView.open(new_path) as new_view:
+        result = colformat.diff_col(old_view,new_view,tolerance)
+    print(result.summary())
+    return 0 if result.identical else 1
+
+
+def output_path(path,extension,output_dir):
+    base = os.path.splitext(os.path.basename(path))[0] + extension
+    return os.path.join(output_dir if output_dir is not None else os.path.dirname(path),base)
+
+
+def run_task(command,path,options):
+    """Process one file, returns (path, message, error) so one bad file does not stop the batch."""
+    try:
+        if command == 'info':
+            return path,describe(path),None
+        if command == 'obj2col':
+            with open(path) as stream:
+                vertices,triangles = read_obj(stream,options['scale'])
+            target = output_path(path,'.col',options['output_dir'])
+            with open(target,'wb') as stream:
+                colformat.pack(stream,vertices,triangles,yaz0_level=options['yaz0'])
+        else:
+            with open(path,'rb') as stream:
+                vertices,triangles = colformat.unpack(stream)
+            if command == 'col2obj':
+                target = output_path(path,'.obj',options['output_dir'])
+                with open(target,'w') as stream:
+                    write_obj(stream,vertices,triangles)
+            else: #recode, in place unless an output directory is given
+                target = output_path(path,'.col',options['output_dir'])
+                data = io.BytesIO()
+                colformat.pack(data,vertices,triangles,yaz0_level=options['yaz0'])
+                with open(target,'wb') as stream:
+                    stream.write(data.getvalue())
+        return path,'{} -> {} ({} triangles)'.format(path,target,len(triangles)),None
+    except Exception as error:
+        return path,None,'{}: {}'.format(type(error).__name__,error)
+
+
+def expand_inputs(inputs,extension): #expand directories and glob patterns into a sorted list of files
+    paths = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern,'**','*' + extension)
+        matches = glob.glob(pattern,recursive=True)
+        if not matches and os.path.exists(pattern):
+            matches = [pattern]
+        paths.extend(match for match in matches if os.path.isfile(match))
+    return sorted(set(paths))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command',choices=('obj2col','col2obj','recode','info','diff'))
+    parser.add_argument('inputs',nargs='+',help='files, directories or glob patterns')
+    parser.add_argument('--output-dir',dest='output_dir',help='write results here instead of next to the inputs')
+    parser.add_argument('--scale',type=float,default=1.0,help='scale factor for obj2col')
+    parser.add_argument('--jobs','-j',type=int,default=os.cpu_count(),help='number of worker processes')
+    parser.add_argument('--quiet','-q',action='store_true',help='only print errors')
+    parser.add_argument('--tolerance',type=float,default=0.0,help='distance below which diff treats vertices as unmoved')
+    parser.add_argument('--yaz0',type=int,nargs='?',const=6,choices=range(10),metavar='LEVEL',help='Yaz0 compress the COL files obj2col and recode write, at effort level 0-9 (default 6)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'diff':
+        if len(args.inputs) != 2:
+            parser.error('diff takes exactly two files')
+        return diff_files(args.inputs[0],args.inputs[1],args.tolerance)
+
+    paths = expand_inputs(args.inputs,'.obj' if args.command == 'obj2col' else '.col')
+    if not paths:
+        parser.error('no input files found')
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir,exist_ok=True)
+    options = {'output_dir':args.output_dir,'scale':args.scale,'yaz0':args.yaz0}
+
+    failures = 0
+    def report(done,result):
+        nonlocal failures
+        path,message,error = result
+        if error is not None:
+            failures += 1
+            print('[{}/{}] FAILED {}: {}'.format(done,len(paths),path,error),file=sys.stderr,flush=True)
+        elif not args.quiet:
+            print('[{}/{}] {}'.format(done,len(paths),message),flush=True)
+
+    if args.jobs <= 1 or len(paths) == 1:
+        for done,path in enumerate(paths,1):
+            report(done,run_task(args.command,path,options))
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [executor.submit(run_task,args.command,path,options) for path in paths]
+            for done,future in enumerate(as_completed(futures),1):
+                report(done,future.result())
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,30 @@
+"""Reading and writing Super Mario Sunshine collision (COL) files.
+
+Only needs btypes and the standard library. The NumPy codec in
+colformat.arrays imports NumPy on first use, colformat.bvh needs NumPy and
+is loaded when first accessed. colformat.yaz0 handles Yaz0 compressed
+files, using NumPy to find matches faster when it is installed.
+"""
+
+__version__ = '1.0.0'
+
+from colformat.structs import Header,Vertex,Group,Triangle,MAX_GROUP_SIZE,group_key
+from colformat.stats import Stats,NullStats,null_stats
+from colformat.tables import VertexTable,TriangleTable,VertexRow,TriangleRow
+from colformat.codec import GroupPlan,layout_groups,split_large_groups,plan_groups,plan_table_groups,pack_bytes,pack,COLWriter,unpack
+from colformat.arrays import COLArrays,pack_arrays,unpack_arrays
+from colformat.view import COLView,GroupView,VertexView,TriangleView
+from colformat.diff import COLDiff,GroupDiff,diff_col
+from colformat.validation import Finding,ValidationReport,MAX_VERTEX_COUNT,validate
+from colformat.mesh import weld_vertices,morton_code,hilbert_code,reorder_spatially,material_key,plan_import,col_space_transform,transform_vertices,mesh_block
+from colformat.cache import ExportCache,mesh_content_key,rebase_blocks,ParseCache,decoded_size
+from colformat.simplify import merge_coplanar
+from colformat.job import ExportJob,JobCancelled
+from colformat import yaz0
+
+
+def __getattr__(name):
+    if name == 'bvh': #needs NumPy, so only import it when asked for
+        import colformat.bvh
+        return colformat.bvh
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__,name))
@@ -0,0 +1,156 @@
+import io
+from colformat.structs import Header,Vertex,Group,Triangle,MAX_GROUP_SIZE
+from colformat import yaz0
+
+
+class COLArrays:
+    """Column representation of a COL file, backed by NumPy arrays.
+
+    vertices is an (N,3) '>f4' array and vertex_indices an (M,3) '>u2' array.
+    ColType, TerrainType, unknown and ColParameter are parallel per-triangle
+    arrays, has_ColParameter is a bool mask marking which ColParameter values
+    are present (absent values are stored as 0).
+    """
+
+    def __init__(self,vertices,vertex_indices,ColType,TerrainType,unknown,ColParameter,has_ColParameter):
+        import numpy
+        self.vertices = numpy.asarray(vertices,dtype='>f4').reshape(-1,3)
+        self.vertex_indices = numpy.asarray(vertex_indices,dtype='>u2').reshape(-1,3)
+        self.ColType = numpy.asarray(ColType,dtype='>u2')
+        self.TerrainType = numpy.asarray(TerrainType,dtype='u1')
+        self.unknown = numpy.asarray(unknown,dtype='u1')
+        self.has_ColParameter = numpy.asarray(has_ColParameter,dtype=bool)
+        self.ColParameter = numpy.where(self.has_ColParameter,numpy.asarray(ColParameter,dtype='>u2'),0).astype('>u2')
+
+    @property
+    def triangle_count(self):
+        return len(self.vertex_indices)
+
+    @classmethod
+    def from_objects(cls,vertices,triangles): #convert lists of Vertex and Triangle objects
+        return cls(
+            [(vertex.x,vertex.y,vertex.z) for vertex in vertices],
+            [triangle.vertex_indices[:3] for triangle in triangles],
+            [triangle.ColType for triangle in triangles],
+            [triangle.TerrainType for triangle in triangles],
+            [triangle.unknown for triangle in triangles],
+            [triangle.ColParameter or 0 for triangle in triangles],
+            [triangle.ColParameter is not None for triangle in triangles])
+
+    @classmethod
+    def from_tables(cls,vertices,triangles): #convert a VertexTable and a TriangleTable
+        columns = triangles.numpy()
+        return cls(vertices.numpy(),columns['vertex_indices'],columns['ColType'],columns['TerrainType'],
+            columns['unknown'],columns['ColParameter'],columns['has_ColParameter'])
+
+    def to_objects(self): #convert back into lists of Vertex and Triangle objects
+        vertices = [Vertex(x,y,z) for x,y,z in self.vertices.tolist()]
+        triangles = []
+        rows = zip(self.vertex_indices.tolist(),self.ColType.tolist(),self.TerrainType.tolist(),
+            self.unknown.tolist(),self.ColParameter.tolist(),self.has_ColParameter.tolist())
+        for vertex_indices,ColType,TerrainType,unknown,ColParameter,has_ColParameter in rows:
+            triangle = Triangle()
+            triangle.vertex_indices = vertex_indices
+            triangle.ColType = ColType
+            triangle.TerrainType = TerrainType
+            triangle.unknown = unknown
+            triangle.ColParameter = ColParameter if has_ColParameter else None
+            triangles.append(triangle)
+        return vertices,triangles
+
+
+def pack_arrays(stream,arrays,sort_groups=False,yaz0_level=None): #pack a COLArrays into col file, byte-identical to pack()
+    import numpy
+
+    #groups are keyed on (ColType,has_ColParameter) and ordered by first appearance, like in pack()
+    keys = arrays.ColType.astype(numpy.int64)*2 + arrays.has_ColParameter
+    group_keys,first_index,group_ids = numpy.unique(keys,return_index=True,return_inverse=True)
+    if sort_groups:
+        group_order = numpy.arange(len(group_keys))
+    else:
+        group_order = numpy.argsort(first_index,kind='stable')
+    group_rank = numpy.empty_like(group_order)
+    group_rank[group_order] = numpy.arange(len(group_order))
+    triangle_order = numpy.argsort(group_rank[group_ids.reshape(-1)],kind='stable')
+
+    group_counts = numpy.bincount(group_rank[group_ids.reshape(-1)],minlength=len(group_order)).tolist()
+    group_has_ColParameter = (group_keys[group_order] & 1).astype(bool)
+
+    chunks = [] #(CollisionType,has_ColParameter,triangle count) of each written group
+    for i in range(len(group_order)):
+        for start in range(0,group_counts[i],MAX_GROUP_SIZE):
+            chunks.append((int(group_keys[group_order[i]] >> 1),bool(group_has_ColParameter[i]),min(MAX_GROUP_SIZE,group_counts[i] - start)))
+
+    header = Header()
+    header.vertex_count = len(arrays.vertices)
+    header.vertex_offset = Header.sizeof() + Group.sizeof()*len(chunks)
+    header.group_count = len(chunks)
+    header.group_offset = Header.sizeof()
+
+    triangle_count = arrays.triangle_count
+    vertex_index_offset = header.vertex_offset + 12*header.vertex_count
+    TerrainType_offset = vertex_index_offset + 6*triangle_count
+    unknown_offset = TerrainType_offset + triangle_count
+    ColParameter_offset = unknown_offset + triangle_count
+
+    groups = []
+    start = 0
+    ColParameter_start = 0
+    for CollisionType,has_ColParameter,count in chunks:
+        group = Group()
+        group.CollisionType = CollisionType
+        group.triangle_count = count
+        group.has_ColParameter = has_ColParameter
+        group.vertex_index_offset = vertex_index_offset + 6*start
+        group.TerrainType_offset = TerrainType_offset + start
+        group.unknown_offset = unknown_offset + start
+        if group.has_ColParameter:
+            group.ColParameter_offset = ColParameter_offset + 2*ColParameter_start
+            ColParameter_start += count
+        else:
+            group.ColParameter_offset = 0
+        start += count
+        groups.append(group)
+
+    with_ColParameter = group_has_ColParameter[group_rank[group_ids.reshape(-1)]][triangle_order]
+
+    header_data = io.BytesIO()
+    Header.pack(header_data,header)
+    Group.pack_many(header_data,groups)
+    data = b''.join((
+        header_data.getvalue(),
+        arrays.vertices.astype('>f4',copy=False).tobytes(),
+        arrays.vertex_indices[triangle_order].astype('>u2',copy=False).tobytes(),
+        arrays.TerrainType[triangle_order].astype('u1',copy=False).tobytes(),
+        arrays.unknown[triangle_order].astype('u1',copy=False).tobytes(),
+        arrays.ColParameter[triangle_order][with_ColParameter].astype('>u2',copy=False).tobytes()))
+    if yaz0_level is not None: data = yaz0.compress(data,yaz0_level)
+    stream.write(data)
+
+
+def unpack_arrays(stream): #unpack col file into a COLArrays
+    import numpy
+
+    data = stream.read()
+    if yaz0.is_compressed(data): data = yaz0.decompress(data)
+    header = Header.unpack_from(data,0)
+    groups = Group.unpack_many_from(data,header.group_offset,header.group_count)
+
+    vertices = numpy.frombuffer(data,dtype='>f4',count=3*header.vertex_count,offset=header.vertex_offset).reshape(-1,3)
+
+    def section(dtype,count,offset):
+        return numpy.frombuffer(data,dtype=dtype,count=count,offset=offset)
+
+    empty_u1 = numpy.empty(0,dtype='u1')
+    empty_u2 = numpy.empty(0,dtype='>u2')
+    counts = [group.triangle_count for group in groups]
+    vertex_indices = numpy.concatenate([section('>u2',3*group.triangle_count,group.vertex_index_offset) for group in groups] or [empty_u2])
+    TerrainType = numpy.concatenate([section('u1',group.triangle_count,group.TerrainType_offset) for group in groups] or [empty_u1])
+    unknown = numpy.concatenate([section('u1',group.triangle_count,group.unknown_offset) for group in groups] or [empty_u1])
+    ColParameter = numpy.concatenate([
+        section('>u2',group.triangle_count,group.ColParameter_offset) if group.has_ColParameter else numpy.zeros(group.triangle_count,dtype='>u2')
+        for group in groups] or [empty_u2])
+    ColType = numpy.repeat(numpy.array([group.CollisionType for group in groups],dtype='>u2'),counts)
+    has_ColParameter = numpy.repeat(numpy.array([group.has_ColParameter for group in groups],dtype=bool),counts)
+
+    return COLArrays(vertices,vertex_indices,ColType,TerrainType,unknown,ColParameter,has_ColParameter)
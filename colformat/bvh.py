@@ -0,0 +1,380 @@
+"""Bounding volume hierarchy over COL triangles for spatial queries.
+
+Build one from unpack() output, a COLArrays or a COLView and ask it what is
+under a point, what a ray hits, which triangle is nearest or which triangles
+are in a box. Coordinates are in COL space, y is up. Requires NumPy.
+"""
+
+import heapq
+from math import inf,sqrt
+
+import numpy
+
+
+class Hit:
+    """A query result: the triangle index, its decoded Triangle and where it was hit."""
+
+    def __init__(self,index,triangle,distance,point):
+        self.index = index
+        self.triangle = triangle
+        self.distance = distance
+        self.point = point
+
+    @property
+    def ColType(self):
+        return self.triangle.ColType
+
+    @property
+    def TerrainType(self):
+        return self.triangle.TerrainType
+
+    @property
+    def unknown(self):
+        return self.triangle.unknown
+
+    @property
+    def ColParameter(self):
+        return self.triangle.ColParameter
+
+    def __repr__(self):
+        return 'Hit(index={}, distance={}, point={})'.format(self.index,self.distance,self.point)
+
+
+class TriangleBVH:
+    """BVH over triangle bounding boxes, built with vectorized binned SAH or median splits.
+
+    positions is an (N,3) array of vertex positions and indices an (M,3) array
+    of vertex indices. triangles is any sequence that gives the Triangle for a
+    triangle index, it is only accessed for query results.
+    """
+
+    SAH_BINS = 16
+
+    def __init__(self,positions,indices,triangles,leaf_size=4,split='sah'):
+        if split not in ('sah','median'):
+            raise ValueError('split must be sah or median')
+        positions = numpy.asarray(positions,dtype=numpy.float64).reshape(-1,3)
+        indices = numpy.asarray(indices,dtype=numpy.int64).reshape(-1,3)
+        self.triangles = triangles
+        self.leaf_size = max(1,leaf_size)
+        self.split = split
+
+        corners = positions[indices] #(M,3,3)
+        self.corners = corners
+        self.triangle_min = corners.min(axis=1)
+        self.triangle_max = corners.max(axis=1)
+        self.centroids = corners.mean(axis=1)
+        self.build()
+
+        #queries walk the tree in Python, plain lists are much faster to index than arrays
+        self.node_min = [tuple(bounds) for bounds in self.node_min_array.tolist()]
+        self.node_max = [tuple(bounds) for bounds in self.node_max_array.tolist()]
+        self.corner_list = corners.tolist()
+        self.triangle_min_list = self.triangle_min.tolist()
+        self.triangle_max_list = self.triangle_max.tolist()
+        self.order_list = self.order.tolist()
+
+    @classmethod
+    def from_objects(cls,vertices,triangles,**options): #from the lists returned by unpack()
+        positions = [(vertex.x,vertex.y,vertex.z) for vertex in vertices]
+        indices = [triangle.vertex_indices[:3] for triangle in triangles]
+        return cls(numpy.array(positions,dtype=numpy.float64).reshape(-1,3),numpy.array(indices,dtype=numpy.int64).reshape(-1,3),triangles,**options)
+
+    @classmethod
+    def from_arrays(cls,arrays,triangle_factory,**options): #from a COLArrays, triangle_factory turns a row index into a Triangle
+        return cls(arrays.vertices,arrays.vertex_indices,LazyRows(arrays.triangle_count,triangle_factory),**options)
+
+    @classmethod
+    def from_view(cls,view,**options): #from a COLView, vertex and index data are read straight from its buffer
+        header = view.header
+        positions = numpy.frombuffer(view.buffer,dtype='>f4',count=3*header.vertex_count,offset=header.vertex_offset)
+        sections = [numpy.frombuffer(view.buffer,dtype='>u2',count=3*len(group),offset=group.group.vertex_index_offset) for group in view.groups]
+        indices = numpy.concatenate(sections) if sections else numpy.empty(0,dtype='>u2')
+        return cls(positions,indices,view.triangles,**options)
+
+    def __len__(self):
+        return len(self.corners)
+
+    def build(self):
+        count = len(self.corners)
+        self.order = numpy.arange(count)
+        node_min = []
+        node_max = []
+        self.node_left = [] #child node index, -1 for leaves
+        self.node_right = []
+        self.node_start = [] #range of self.order covered by a leaf
+        self.node_count = []
+
+        def new_node(start,end):
+            subset = self.order[start:end]
+            if end > start:
+                node_min.append(self.triangle_min[subset].min(axis=0))
+                node_max.append(self.triangle_max[subset].max(axis=0))
+            else: #empty tree
+                node_min.append(numpy.full(3,inf))
+                node_max.append(numpy.full(3,-inf))
+            self.node_left.append(-1)
+            self.node_right.append(-1)
+            self.node_start.append(start)
+            self.node_count.append(end - start)
+            return len(self.node_left) - 1
+
+        stack = [(new_node(0,count),0,count)]
+        while stack:
+            node,start,end = stack.pop()
+            if end - start <= self.leaf_size: continue
+            middle = self.partition(start,end)
+            if middle is None: continue #triangles can not be separated, keep them in a leaf
+            self.node_left[node] = new_node(start,middle)
+            self.node_right[node] = new_node(middle,end)
+            self.node_count[node] = 0
+            stack.append((self.node_left[node],start,middle))
+            stack.append((self.node_right[node],middle,end))
+
+        self.node_min_array = numpy.array(node_min).reshape(-1,3)
+        self.node_max_array = numpy.array(node_max).reshape(-1,3)
+
+    def partition(self,start,end): #reorder self.order[start:end] into two halves, returns the split position
+        subset = self.order[start:end]
+        centroids = self.centroids[subset]
+        low = centroids.min(axis=0)
+        extent = centroids.max(axis=0) - low
+        axis = int(extent.argmax())
+        if extent[axis] <= 0: return None
+
+        if self.split == 'sah':
+            middle = self.partition_sah(start,subset,centroids[:,axis],low[axis],extent[axis])
+            if middle is not None:
+                return start + middle
+
+        half = len(subset)//2
+        self.order[start:end] = subset[numpy.argpartition(centroids[:,axis],half)]
+        return start + half
+
+    def partition_sah(self,start,subset,centroids,low,extent): #binned surface area heuristic, None if no split beats a median split
+        bins = self.SAH_BINS
+        bin_ids = numpy.minimum(((centroids - low)/extent*bins).astype(numpy.int64),bins - 1)
+        counts = numpy.bincount(bin_ids,minlength=bins)
+        bin_min = numpy.full((bins,3),inf)
+        bin_max = numpy.full((bins,3),-inf)
+        numpy.minimum.at(bin_min,bin_ids,self.triangle_min[subset])
+        numpy.maximum.at(bin_max,bin_ids,self.triangle_max[subset])
+
+        def areas(minimum,maximum):
+            size = numpy.maximum(maximum - minimum,0)
+            return size[:,0]*size[:,1] + size[:,1]*size[:,2] + size[:,2]*size[:,0]
+
+        left_area = areas(numpy.minimum.accumulate(bin_min),numpy.maximum.accumulate(bin_max))[:-1]
+        right_area = areas(numpy.minimum.accumulate(bin_min[::-1])[::-1],numpy.maximum.accumulate(bin_max[::-1])[::-1])[1:]
+        left_count = numpy.cumsum(counts)[:-1]
+        right_count = len(subset) - left_count
+        cost = left_area*left_count + right_area*right_count
+        cost[(left_count == 0) | (right_count == 0)] = inf
+        best = int(cost.argmin())
+        if cost[best] == inf: return None
+
+        mask = bin_ids <= best
+        self.order[start:start + len(subset)] = numpy.concatenate((subset[mask],subset[~mask]))
+        return int(mask.sum())
+
+    def leaf_triangles(self,node):
+        start = self.node_start[node]
+        return self.order_list[start:start + self.node_count[node]]
+
+    def hit(self,index,distance,point):
+        return Hit(index,self.triangles[index],distance,point)
+
+    def raycast(self,origin,direction,max_distance=inf,backfaces=True):
+        """First triangle hit by the ray, as a Hit, or None.
+
+        direction does not need to be normalized, distance is measured in
+        multiples of its length. With backfaces off, triangles facing away
+        from the ray (by their winding) are ignored.
+        """
+        if not self.node_left: return None
+        ox,oy,oz = origin
+        dx,dy,dz = direction
+        inverse = [1/d if d != 0 else inf for d in (dx,dy,dz)]
+        best = max_distance
+        best_index = None
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            entry = self.ray_box(node,origin,direction,inverse,best)
+            if entry is None: continue
+            left = self.node_left[node]
+            if left < 0:
+                for i in self.leaf_triangles(node):
+                    t = self.ray_triangle(i,ox,oy,oz,dx,dy,dz,backfaces)
+                    if t is not None and t < best:
+                        best = t
+                        best_index = i
+                continue
+            right = self.node_right[node]
+            left_entry = self.ray_box(left,origin,direction,inverse,best)
+            right_entry = self.ray_box(right,origin,direction,inverse,best)
+            if left_entry is not None and right_entry is not None:
+                stack.extend((left,right) if left_entry > right_entry else (right,left)) #visit the nearer child first
+            elif left_entry is not None:
+                stack.append(left)
+            elif right_entry is not None:
+                stack.append(right)
+        if best_index is None: return None
+        return self.hit(best_index,best,(ox + dx*best,oy + dy*best,oz + dz*best))
+
+    def probe_down(self,point,max_distance=inf):
+        """The triangle directly under point, as a Hit, or None."""
+        return self.raycast(point,(0.0,-1.0,0.0),max_distance)
+
+    def ray_box(self,node,origin,direction,inverse,max_distance): #distance at which the ray enters the node box, None if it misses
+        low = self.node_min[node]
+        high = self.node_max[node]
+        near = 0.0
+        far = max_distance
+        for axis in range(3):
+            o = origin[axis]
+            if direction[axis] == 0:
+                if o < low[axis] or o > high[axis]: return None
+                continue
+            t0 = (low[axis] - o)*inverse[axis]
+            t1 = (high[axis] - o)*inverse[axis]
+            if t0 > t1: t0,t1 = t1,t0
+            if t0 > near: near = t0
+            if t1 < far: far = t1
+            if near > far: return None
+        return near
+
+    def ray_triangle(self,index,ox,oy,oz,dx,dy,dz,backfaces): #Moller-Trumbore, returns the ray distance or None
+        (ax,ay,az),(bx,by,bz),(cx,cy,cz) = self.corner_list[index]
+        e1x,e1y,e1z = bx - ax,by - ay,bz - az
+        e2x,e2y,e2z = cx - ax,cy - ay,cz - az
+        px,py,pz = dy*e2z - dz*e2y,dz*e2x - dx*e2z,dx*e2y - dy*e2x
+        determinant = e1x*px + e1y*py + e1z*pz
+        if determinant == 0 or (not backfaces and determinant < 0): return None
+        inverse = 1/determinant
+        sx,sy,sz = ox - ax,oy - ay,oz - az
+        u = (sx*px + sy*py + sz*pz)*inverse
+        if u < 0 or u > 1: return None
+        qx,qy,qz = sy*e1z - sz*e1y,sz*e1x - sx*e1z,sx*e1y - sy*e1x
+        v = (dx*qx + dy*qy + dz*qz)*inverse
+        if v < 0 or u + v > 1: return None
+        t = (e2x*qx + e2y*qy + e2z*qz)*inverse
+        return t if t >= 0 else None
+
+    def nearest(self,point,max_distance=inf):
+        """The triangle closest to point, as a Hit with the closest point on it, or None."""
+        if not self.node_left: return None
+        best = max_distance*max_distance
+        best_index = None
+        best_point = None
+        heap = [(self.box_distance(0,point),0)]
+        while heap:
+            distance,node = heapq.heappop(heap)
+            if distance >= best: break
+            left = self.node_left[node]
+            if left < 0:
+                for i in self.leaf_triangles(node):
+                    closest = closest_point_on_triangle(point,self.corner_list[i])
+                    d = (closest[0] - point[0])**2 + (closest[1] - point[1])**2 + (closest[2] - point[2])**2
+                    if d < best:
+                        best,best_index,best_point = d,i,closest
+                continue
+            for child in (left,self.node_right[node]):
+                child_distance = self.box_distance(child,point)
+                if child_distance < best:
+                    heapq.heappush(heap,(child_distance,child))
+        if best_index is None: return None
+        return self.hit(best_index,sqrt(best),best_point)
+
+    def box_distance(self,node,point): #squared distance from point to the node box
+        low = self.node_min[node]
+        high = self.node_max[node]
+        distance = 0.0
+        for axis in range(3):
+            p = point[axis]
+            if p < low[axis]:
+                distance += (low[axis] - p)**2
+            elif p > high[axis]:
+                distance += (p - high[axis])**2
+        return distance
+
+    def overlap(self,low,high):
+        """Indices of the triangles whose bounding box overlaps the box from low to high."""
+        result = []
+        if not self.node_left: return result
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if not boxes_overlap(self.node_min[node],self.node_max[node],low,high): continue
+            left = self.node_left[node]
+            if left < 0:
+                for i in self.leaf_triangles(node):
+                    if boxes_overlap(self.triangle_min_list[i],self.triangle_max_list[i],low,high):
+                        result.append(i)
+            else:
+                stack.append(left)
+                stack.append(self.node_right[node])
+        return sorted(result)
+
+
+class LazyRows:
+    """Sequence that builds each item on access from its index."""
+
+    def __init__(self,count,factory):
+        self.count = count
+        self.factory = factory
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self,index):
+        if not -self.count <= index < self.count:
+            raise IndexError('index out of range')
+        return self.factory(index % self.count)
+
+
+def boxes_overlap(low_a,high_a,low_b,high_b):
+    return (low_a[0] <= high_b[0] and low_b[0] <= high_a[0] and
+        low_a[1] <= high_b[1] and low_b[1] <= high_a[1] and
+        low_a[2] <= high_b[2] and low_b[2] <= high_a[2])
+
+
+def closest_point_on_triangle(point,corners): #from Ericson, Real-Time Collision Detection 5.1.5
+    (ax,ay,az),(bx,by,bz),(cx,cy,cz) = corners
+    px,py,pz = point
+    abx,aby,abz = bx - ax,by - ay,bz - az
+    acx,acy,acz = cx - ax,cy - ay,cz - az
+    apx,apy,apz = px - ax,py - ay,pz - az
+    d1 = abx*apx + aby*apy + abz*apz
+    d2 = acx*apx + acy*apy + acz*apz
+    if d1 <= 0 and d2 <= 0: return (ax,ay,az)
+
+    bpx,bpy,bpz = px - bx,py - by,pz - bz
+    d3 = abx*bpx + aby*bpy + abz*bpz
+    d4 = acx*bpx + acy*bpy + acz*bpz
+    if d3 >= 0 and d4 <= d3: return (bx,by,bz)
+
+    vc = d1*d4 - d3*d2
+    if vc <= 0 and d1 >= 0 and d3 <= 0:
+        v = d1/(d1 - d3)
+        return (ax + v*abx,ay + v*aby,az + v*abz)
+
+    cpx,cpy,cpz = px - cx,py - cy,pz - cz
+    d5 = abx*cpx + aby*cpy + abz*cpz
+    d6 = acx*cpx + acy*cpy + acz*cpz
+    if d6 >= 0 and d5 <= d6: return (cx,cy,cz)
+
+    vb = d5*d2 - d1*d6
+    if vb <= 0 and d2 >= 0 and d6 <= 0:
+        w = d2/(d2 - d6)
+        return (ax + w*acx,ay + w*acy,az + w*acz)
+
+    va = d3*d6 - d5*d4
+    if va <= 0 and d4 - d3 >= 0 and d5 - d6 >= 0:
+        w = (d4 - d3)/((d4 - d3) + (d5 - d6))
+        return (bx + w*(cx - bx),by + w*(cy - by),bz + w*(cz - bz))
+
+    denominator = 1/(va + vb + vc)
+    v = vb*denominator
+    w = vc*denominator
+    return (ax + abx*v + acx*w,ay + aby*v + acy*w,az + abz*v + acz*w)
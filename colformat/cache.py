@@ -0,0 +1,206 @@
+import io
+import os
+import sys
+from array import array
+from collections import OrderedDict
+from colformat.codec import unpack
+from colformat.stats import null_stats
+from colformat.structs import Triangle
+
+
+class ExportCache:
+    """LRU cache of extracted per-object (vertices,triangles) blocks.
+
+    Blocks use object-local vertex indices and are keyed on a content hash,
+    see object_cache_key. Cached blocks must not be modified, rebase_blocks
+    makes fresh triangles when the blocks are combined.
+    """
+
+    def __init__(self,max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self,key):
+        block = self.entries.get(key)
+        if block is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return block
+
+    def put(self,key,block):
+        self.entries[key] = block
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False) #evict least recently used
+
+    def clear(self):
+        self.entries.clear()
+
+
+def mesh_content_key(coordinates,loop_vertices,loop_totals,material_indices,materials,scale,matrix=None):
+    """Hash of everything that goes into an object's exported block.
+
+    coordinates, loop_vertices, loop_totals and material_indices are flat
+    sequences of the mesh data, materials is a sequence of material_key tuples
+    (or None for empty slots) indexed by material index and matrix is the
+    object's world matrix as a sequence of rows.
+    """
+    import hashlib
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(array('d',coordinates).tobytes())
+    digest.update(array('q',loop_vertices).tobytes())
+    digest.update(array('q',loop_totals).tobytes())
+    digest.update(array('q',material_indices).tobytes())
+    digest.update(repr((list(materials),float(scale))).encode())
+    if matrix is not None:
+        digest.update(array('d',[value for row in matrix for value in row]).tobytes())
+    return digest.digest()
+
+
+def rebase_blocks(blocks): #concatenate (vertices,triangles) blocks, shifting each block's indices past the previous vertices
+    vertices = []
+    triangles = []
+    for block_vertices,block_triangles in blocks:
+        offset = len(vertices)
+        vertices.extend(block_vertices)
+        for triangle in block_triangles:
+            rebased = Triangle()
+            rebased.vertex_indices = [index + offset for index in triangle.vertex_indices]
+            rebased.ColType = triangle.ColType
+            rebased.TerrainType = triangle.TerrainType
+            rebased.unknown = triangle.unknown
+            rebased.ColParameter = triangle.ColParameter
+            triangles.append(rebased)
+    return vertices,triangles
+
+
+def decoded_size(vertices,triangles): #rough memory use of unpacked vertices and triangles, measured on the first of each
+    size = 0
+    for items in (vertices,triangles):
+        if hasattr(items,'nbytes'): #a VertexTable or TriangleTable
+            size += items.nbytes
+            continue
+        if not items: continue
+        item = items[0]
+        if hasattr(item,'__dict__'):
+            values = list(item.__dict__.values())
+            attributes_size = sys.getsizeof(item.__dict__)
+        else:
+            values = [getattr(item,name) for name in type(item).__slots__]
+            attributes_size = 0
+        item_size = sys.getsizeof(item) + attributes_size + sum(sys.getsizeof(value) for value in values)
+        size += sys.getsizeof(items) + len(items)*item_size
+    return size
+
+
+class ParseCache:
+    """LRU cache of decoded COL files in front of unpack.
+
+    Entries are keyed on the absolute path, size and modification time of the
+    file, and with verify=True also on a hash of its contents, which catches
+    changes that keep size and mtime but means the file is still read.
+    Entries are evicted least recently used first once their estimated size
+    exceeds max_bytes. With a spill_dir, evicted entries are pickled there and
+    loaded back instead of decoding the file again. That pays off when
+    reading the file is slow, unpickling is not faster than unpack itself.
+
+    The returned vertices and triangles are shared by every caller that
+    loads the same file and must not be modified.
+    """
+
+    def __init__(self,max_bytes=256 << 20,spill_dir=None,verify=False):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.verify = verify
+        self.entries = OrderedDict() #key -> (vertices,triangles,size)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.spill_hits = 0
+        self.evictions = 0
+
+    def key(self,path,data=None):
+        path = os.path.abspath(path)
+        status = os.stat(path)
+        key = (path,status.st_size,status.st_mtime_ns)
+        if self.verify:
+            import hashlib
+            if data is None:
+                with open(path,'rb') as stream:
+                    data = stream.read()
+            key += (hashlib.blake2b(data,digest_size=16).hexdigest(),)
+        return key
+
+    def load(self,path,stats=null_stats):
+        """Return the unpacked (vertices,triangles) of a COL file."""
+        data = None
+        if self.verify: #read the file once for both the hash and unpack
+            with open(path,'rb') as stream:
+                data = stream.read()
+        key = self.key(path,data)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            stats.count('parse cache hits',1)
+            return entry[0],entry[1]
+
+        self.misses += 1
+        stats.count('parse cache misses',1)
+        vertices_triangles = self.load_spilled(key)
+        if vertices_triangles is not None:
+            self.spill_hits += 1
+        elif data is not None:
+            vertices_triangles = unpack(io.BytesIO(data),stats)
+        else:
+            with open(path,'rb') as stream:
+                vertices_triangles = unpack(stream,stats)
+        self.put(key,*vertices_triangles)
+        return vertices_triangles
+
+    def put(self,key,vertices,triangles):
+        size = decoded_size(vertices,triangles)
+        if size > self.max_bytes: #would evict everything else and still not fit
+            self.spill(key,vertices,triangles)
+            return
+        self.entries[key] = (vertices,triangles,size)
+        self.size += size
+        while self.size > self.max_bytes:
+            old_key,(old_vertices,old_triangles,old_size) = self.entries.popitem(last=False) #evict least recently used
+            self.size -= old_size
+            self.evictions += 1
+            self.spill(old_key,old_vertices,old_triangles)
+
+    def spill_path(self,key):
+        import hashlib
+        return os.path.join(self.spill_dir,hashlib.blake2b(repr(key).encode(),digest_size=16).hexdigest() + '.pickle')
+
+    def spill(self,key,vertices,triangles):
+        if self.spill_dir is None: return
+        import pickle
+        os.makedirs(self.spill_dir,exist_ok=True)
+        path = self.spill_path(key)
+        with open(path + '.tmp','wb') as stream:
+            pickle.dump((vertices,triangles),stream,protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp',path)
+
+    def load_spilled(self,key):
+        if self.spill_dir is None: return None
+        import pickle
+        try:
+            with open(self.spill_path(key),'rb') as stream:
+                return pickle.load(stream)
+        except (OSError,pickle.UnpicklingError,EOFError):
+            return None
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def summary(self):
+        return '{} hits, {} misses ({} from spill), {} evictions, {} entries, {:.1f} MB'.format(
+            self.hits,self.misses,self.spill_hits,self.evictions,len(self.entries),self.size/(1 << 20))
@@ -0,0 +1,368 @@
+import struct
+import sys
+from array import array
+from btypes.big_endian import uint8,uint16
+from colformat.structs import Header,Vertex,Group,Triangle,MAX_GROUP_SIZE,group_key
+from colformat.stats import null_stats
+from colformat.tables import VertexTable,TriangleTable
+from colformat import yaz0
+
+
+class GroupPlan:
+    """Assignment of triangles to groups, together with the file layout.
+
+    groups holds one Group per distinct grouping key, each with its triangles
+    and all section offsets filled in. header is the matching Header.
+    """
+
+    def __init__(self,header,groups,size):
+        self.header = header
+        self.groups = groups
+        self.size = size #total size of the packed file
+
+    def group_counts(self):
+        return [group.triangle_count for group in self.groups]
+
+
+def layout_groups(vertex_count,groups): #fill in the section offsets of groups, returns the header and total file size
+    header = Header()
+    header.vertex_count = vertex_count
+    header.vertex_offset = Header.sizeof() + Group.sizeof()*len(groups)
+    header.group_count = len(groups)
+    header.group_offset = Header.sizeof()
+
+    offset = header.vertex_offset + Vertex.sizeof()*vertex_count
+    for group in groups:
+        group.vertex_index_offset = offset
+        offset += 6*group.triangle_count
+    for group in groups:
+        group.TerrainType_offset = offset
+        offset += group.triangle_count
+    for group in groups:
+        group.unknown_offset = offset
+        offset += group.triangle_count
+    for group in groups:
+        if not group.has_ColParameter:
+            group.ColParameter_offset = 0
+        else:
+            group.ColParameter_offset = offset
+            offset += 2*group.triangle_count
+
+    return header,offset
+
+
+def split_large_groups(groups): #groups with more triangles than a Group can count are written as several groups
+    result = []
+    for group in groups:
+        if len(group.triangles) <= MAX_GROUP_SIZE:
+            result.append(group)
+            continue
+        for start in range(0,len(group.triangles),MAX_GROUP_SIZE):
+            chunk = Group()
+            chunk.CollisionType = group.CollisionType
+            chunk.has_ColParameter = group.has_ColParameter
+            chunk.triangles = group.triangles[start:start + MAX_GROUP_SIZE]
+            result.append(chunk)
+    return result
+
+
+def plan_groups(vertices,triangles,key=group_key,sort=False): #bucket triangles into groups and lay out the sections
+    buckets = {}
+    for triangle in triangles:
+        k = key(triangle)
+        group = buckets.get(k)
+        if group is None: #first triangle with this key
+            group = Group()
+            group.CollisionType = triangle.ColType
+            group.has_ColParameter = False
+            group.triangles = []
+            buckets[k] = group
+        elif triangle.ColType != group.CollisionType:
+            raise ValueError('grouping key must separate triangles with different ColType')
+        group.triangles.append(triangle)
+        if triangle.ColParameter is not None:
+            group.has_ColParameter = True
+
+    if sort:
+        groups = [buckets[k] for k in sorted(buckets)]
+    else:
+        groups = list(buckets.values()) #dicts keep first seen order
+    groups = split_large_groups(groups)
+
+    for group in groups:
+        group.triangle_count = len(group.triangles)
+
+    header,size = layout_groups(len(vertices),groups)
+    return GroupPlan(header,groups,size)
+
+
+def plan_table_groups(vertex_count,table,sort=False): #plan_groups for a TriangleTable with the default grouping key, group.triangles holds row numbers
+    buckets = {}
+    for row,k in enumerate(zip(table.ColType,table.has_ColParameter)):
+        rows = buckets.get(k)
+        if rows is None:
+            rows = buckets[k] = array('i')
+        rows.append(row)
+
+    groups = []
+    for k in (sorted(buckets) if sort else buckets):
+        group = Group()
+        group.CollisionType = k[0]
+        group.has_ColParameter = bool(k[1])
+        group.triangles = buckets[k]
+        groups.append(group)
+    groups = split_large_groups(groups)
+
+    for group in groups:
+        group.triangle_count = len(group.triangles)
+
+    header,size = layout_groups(vertex_count,groups)
+    return GroupPlan(header,groups,size)
+
+
+def big_endian_bytes(values): #contents of an array as big endian bytes
+    if sys.byteorder == 'little' and values.itemsize > 1:
+        values = array(values.typecode,values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def pack_bytes(vertices,triangles,key=group_key,sort_groups=False,stats=null_stats): #encode a col file into a single preallocated buffer
+    with stats.phase('group'):
+        if isinstance(triangles,TriangleTable) and key is group_key:
+            plan = plan_table_groups(len(vertices),triangles,sort_groups)
+        else:
+            plan = plan_groups(vertices,triangles,key,sort_groups)
+    groups = plan.groups
+    stats.count('vertices',len(vertices))
+    stats.count('triangles',len(triangles))
+    stats.count('groups',len(groups))
+
+    with stats.phase('encode'):
+        buffer = bytearray(plan.size)
+        if isinstance(triangles,TriangleTable) and key is group_key:
+            encode_table_plan(buffer,plan,vertices,triangles)
+        else:
+            encode_plan(buffer,plan,vertices)
+    return buffer
+
+
+def encode_vertices(buffer,offset,vertices):
+    if isinstance(vertices,VertexTable):
+        data = big_endian_bytes(vertices.coordinates)
+        buffer[offset:offset + len(data)] = data
+    else:
+        Vertex.pack_many_into(buffer,offset,vertices)
+
+
+def encode_plan(buffer,plan,vertices):
+    groups = plan.groups
+
+    Header.pack_into(buffer,0,plan.header)
+    Group.pack_many_into(buffer,plan.header.group_offset,groups)
+    encode_vertices(buffer,plan.header.vertex_offset,vertices)
+
+    for group in groups:
+        uint16.pack_many_into(buffer,group.vertex_index_offset,[index for triangle in group.triangles for index in triangle.vertex_indices[:3]])
+        uint8.pack_many_into(buffer,group.TerrainType_offset,[triangle.TerrainType for triangle in group.triangles])
+        uint8.pack_many_into(buffer,group.unknown_offset,[triangle.unknown for triangle in group.triangles])
+        if group.has_ColParameter:
+            uint16.pack_many_into(buffer,group.ColParameter_offset,[triangle.ColParameter if triangle.ColParameter is not None else 0 for triangle in group.triangles])
+
+
+def encode_table_plan(buffer,plan,vertices,table): #encode_plan for a plan from plan_table_groups
+    groups = plan.groups
+
+    Header.pack_into(buffer,0,plan.header)
+    Group.pack_many_into(buffer,plan.header.group_offset,groups)
+    encode_vertices(buffer,plan.header.vertex_offset,vertices)
+
+    vertex_indices = table.vertex_indices
+    for group in groups:
+        rows = group.triangles
+        sections = [
+            (group.vertex_index_offset,array('H',[vertex_indices[3*row + corner] for row in rows for corner in (0,1,2)])),
+            (group.TerrainType_offset,array('B',[table.TerrainType[row] for row in rows])),
+            (group.unknown_offset,array('B',[table.unknown[row] for row in rows]))]
+        if group.has_ColParameter:
+            sections.append((group.ColParameter_offset,array('H',[table.ColParameter[row] for row in rows])))
+        for offset,values in sections:
+            data = big_endian_bytes(values)
+            buffer[offset:offset + len(data)] = data
+
+
+def pack(stream,vertices,triangles,key=group_key,sort_groups=False,stats=null_stats,yaz0_level=None): #pack triangles into col file, stream does not need to be seekable
+    buffer = pack_bytes(vertices,triangles,key,sort_groups,stats)
+    if yaz0_level is not None: #Yaz0 compress the file with this effort level
+        with stats.phase('compress'):
+            buffer = yaz0.compress(buffer,yaz0_level)
+    with stats.phase('write'):
+        stream.write(buffer)
+    stats.count('bytes written',len(buffer))
+
+
+class COLWriter:
+    """Incremental COL writer that keeps only compact encoded bytes in memory.
+
+    Add vertices and triangles in any order, then call finish() to lay out
+    and write the file. The output is the same as pack() for the same
+    vertices, triangles and grouping key.
+    """
+
+    def __init__(self,stream,key=group_key,sort_groups=False):
+        self.stream = stream
+        self.key = key
+        self.sort_groups = sort_groups
+        self.vertex_data = bytearray()
+        self.vertex_count = 0
+        self.buckets = {}
+
+    def add_vertex(self,vertex):
+        self.vertex_data += Vertex.struct_codec.pack(vertex)
+        self.vertex_count += 1
+        return self.vertex_count - 1
+
+    def add_vertices(self,vertices):
+        for vertex in vertices:
+            self.add_vertex(vertex)
+
+    def add_triangle(self,triangle):
+        k = self.key(triangle)
+        chunks = self.buckets.get(k) #groups for this key, a new one is started when the last one is full
+        if chunks is None: #first triangle with this key
+            chunks = self.buckets[k] = []
+        elif triangle.ColType != chunks[0].CollisionType:
+            raise ValueError('grouping key must separate triangles with different ColType')
+        if not chunks or chunks[-1].triangle_count == MAX_GROUP_SIZE:
+            group = Group()
+            group.CollisionType = triangle.ColType
+            group.has_ColParameter = False
+            group.triangle_count = 0
+            group.vertex_index_data = bytearray()
+            group.TerrainType_data = bytearray()
+            group.unknown_data = bytearray()
+            group.ColParameter_data = bytearray()
+            chunks.append(group)
+        group = chunks[-1]
+        group.vertex_index_data += struct.pack('>3H',*triangle.vertex_indices[:3])
+        group.TerrainType_data.append(triangle.TerrainType)
+        group.unknown_data.append(triangle.unknown)
+        if triangle.ColParameter is not None:
+            group.has_ColParameter = True
+            group.ColParameter_data += struct.pack('>H',triangle.ColParameter)
+        else:
+            group.ColParameter_data += b'\x00\x00'
+        group.triangle_count += 1
+
+    def add_triangles(self,triangles):
+        for triangle in triangles:
+            self.add_triangle(triangle)
+
+    def finish(self):
+        keys = sorted(self.buckets) if self.sort_groups else list(self.buckets)
+        groups = []
+        for k in keys:
+            chunks = self.buckets[k]
+            has_ColParameter = any(chunk.has_ColParameter for chunk in chunks)
+            for chunk in chunks:
+                chunk.has_ColParameter = has_ColParameter
+            groups.extend(chunks)
+
+        header,size = layout_groups(self.vertex_count,groups)
+        buffer = bytearray(size)
+        Header.pack_into(buffer,0,header)
+        Group.pack_many_into(buffer,header.group_offset,groups)
+        buffer[header.vertex_offset:header.vertex_offset + len(self.vertex_data)] = self.vertex_data
+        for group in groups:
+            buffer[group.vertex_index_offset:group.vertex_index_offset + 6*group.triangle_count] = group.vertex_index_data
+            buffer[group.TerrainType_offset:group.TerrainType_offset + group.triangle_count] = group.TerrainType_data
+            buffer[group.unknown_offset:group.unknown_offset + group.triangle_count] = group.unknown_data
+            if group.has_ColParameter:
+                buffer[group.ColParameter_offset:group.ColParameter_offset + 2*group.triangle_count] = group.ColParameter_data
+        self.stream.write(buffer)
+        self.buckets = {}
+        self.vertex_data = bytearray()
+        return size
+
+
+def read_section(data,typecode,offset,count): #array of count big endian values at offset
+    values = array(typecode)
+    end = offset + count*values.itemsize
+    if end > len(data):
+        raise struct.error('section at {} runs past the end of the file'.format(offset))
+    values.frombytes(data[offset:end])
+    if sys.byteorder == 'little' and values.itemsize > 1:
+        values.byteswap()
+    return values
+
+
+def read_tables(data,header,groups): #the vertices and triangles of a col file as a VertexTable and a TriangleTable
+    vertices = VertexTable()
+    vertices.coordinates = read_section(data,'f',header.vertex_offset,3*header.vertex_count)
+    triangles = TriangleTable()
+    for group in groups:
+        count = group.triangle_count
+        triangles.vertex_indices.extend(array('i',read_section(data,'H',group.vertex_index_offset,3*count)))
+        triangles.ColType.extend(array('H',[group.CollisionType])*count)
+        triangles.TerrainType.extend(read_section(data,'B',group.TerrainType_offset,count))
+        triangles.unknown.extend(read_section(data,'B',group.unknown_offset,count))
+        if group.has_ColParameter:
+            triangles.ColParameter.extend(read_section(data,'H',group.ColParameter_offset,count))
+        else:
+            triangles.ColParameter.extend(array('H',bytes(2*count)))
+        triangles.has_ColParameter.extend(array('B',[group.has_ColParameter])*count)
+    return vertices,triangles
+
+
+def unpack(stream,stats=null_stats,tables=False): #returns lists of Vertex and Triangle objects, or a VertexTable and a TriangleTable if tables is set
+    with stats.phase('read'):
+        data = stream.read() #every section is decoded straight from this buffer
+    if yaz0.is_compressed(data):
+        with stats.phase('decompress'):
+            data = yaz0.decompress(data)
+
+    with stats.phase('read header'):
+        header = Header.unpack_from(data,0)
+        groups = Group.unpack_many_from(data,header.group_offset,header.group_count)
+
+    if tables:
+        with stats.phase('read tables'):
+            vertices,triangles = read_tables(data,header,groups)
+        stats.count('vertices',len(vertices))
+        stats.count('triangles',len(triangles))
+        stats.count('groups',len(groups))
+        return vertices,triangles
+
+    with stats.phase('read vertices'):
+        vertices = Vertex.unpack_many_from(data,header.vertex_offset,header.vertex_count)
+
+    with stats.phase('read triangles'):
+        for group in groups:
+            group.triangles = [Triangle() for _ in range(group.triangle_count)]
+            for triangle in group.triangles:
+                triangle.ColType = group.CollisionType
+
+        for group in groups:
+            indices = uint16.unpack_many_from(data,group.vertex_index_offset,3*group.triangle_count)
+            for i,triangle in enumerate(group.triangles):
+                triangle.vertex_indices = indices[3*i:3*i + 3]
+
+        for group in groups:
+            for triangle,TerrainType in zip(group.triangles,uint8.unpack_many_from(data,group.TerrainType_offset,group.triangle_count)):
+                triangle.TerrainType = TerrainType
+
+        for group in groups:
+            for triangle,unknown in zip(group.triangles,uint8.unpack_many_from(data,group.unknown_offset,group.triangle_count)):
+                triangle.unknown = unknown
+
+        for group in groups:
+            if not group.has_ColParameter: continue
+            for triangle,ColParameter in zip(group.triangles,uint16.unpack_many_from(data,group.ColParameter_offset,group.triangle_count)):
+                triangle.ColParameter = ColParameter
+
+        triangles = [triangle for group in groups for triangle in group.triangles]
+
+    stats.count('vertices',len(vertices))
+    stats.count('triangles',len(triangles))
+    stats.count('groups',len(groups))
+    return vertices,triangles
@@ -0,0 +1,205 @@
+import sys
+from array import array
+
+
+class GroupDiff:
+    """Differences between a group of the old file and the matching group of the new file.
+
+    status is 'unchanged', 'changed', 'added' or 'removed'. added and removed
+    hold triangle indices within the new and old group, modified holds
+    (old index,new index,{attribute:(old value,new value)}) for triangles
+    whose geometry matched but whose attributes did not.
+    """
+
+    def __init__(self,key,status,old_count,new_count):
+        self.key = key #(CollisionType,has_ColParameter)
+        self.status = status
+        self.old_count = old_count
+        self.new_count = new_count
+        self.added = []
+        self.removed = []
+        self.modified = []
+
+
+class COLDiff:
+    """Structural differences between two COL files, see diff_col."""
+
+    def __init__(self):
+        self.old_vertex_count = 0
+        self.new_vertex_count = 0
+        self.moved_vertices = [] #(index,old position,new position) of vertices that moved more than the tolerance
+        self.groups = []
+
+    @property
+    def identical(self):
+        return (self.old_vertex_count == self.new_vertex_count and not self.moved_vertices and
+            all(group.status == 'unchanged' for group in self.groups))
+
+    def counts(self):
+        return {
+            'added':sum(len(group.added) for group in self.groups),
+            'removed':sum(len(group.removed) for group in self.groups),
+            'modified':sum(len(group.modified) for group in self.groups),
+            'moved vertices':len(self.moved_vertices),
+        }
+
+    def summary(self):
+        if self.identical: return 'no differences'
+        lines = []
+        if self.old_vertex_count != self.new_vertex_count:
+            lines.append('vertices: {} -> {}'.format(self.old_vertex_count,self.new_vertex_count))
+        if self.moved_vertices:
+            lines.append('{} vertices moved'.format(len(self.moved_vertices)))
+        for group in self.groups:
+            if group.status == 'unchanged': continue
+            lines.append('group ColType {}{}: {} ({} -> {} triangles, {} added, {} removed, {} modified)'.format(
+                group.key[0],' with ColParameter' if group.key[1] else '',group.status,group.old_count,group.new_count,
+                len(group.added),len(group.removed),len(group.modified)))
+        return '\n'.join(lines)
+
+
+def section_hash(buffer,offset,length):
+    import hashlib
+    return hashlib.blake2b(buffer[offset:offset + length],digest_size=16).digest()
+
+
+def group_section_hashes(view,group):
+    group = group.group
+    count = group.triangle_count
+    return (
+        section_hash(view.buffer,group.vertex_index_offset,6*count),
+        section_hash(view.buffer,group.TerrainType_offset,count),
+        section_hash(view.buffer,group.unknown_offset,count),
+        section_hash(view.buffer,group.ColParameter_offset,2*count) if group.has_ColParameter else None)
+
+
+def read_positions(view): #all vertex positions of a view as a flat list of floats
+    data = array('f')
+    data.frombytes(view.buffer[view.header.vertex_offset:view.header.vertex_offset + 12*view.header.vertex_count])
+    if sys.byteorder == 'little': data.byteswap()
+    return data.tolist()
+
+
+def group_triangle_keys(view,groups,positions,tolerance): #canonical geometry key and attributes of each triangle in a list of groups
+    buffer = view.buffer
+    vertex_count = len(positions)//3
+    def point(index):
+        if index >= vertex_count: return ('missing',index)
+        x,y,z = positions[3*index:3*index + 3]
+        if tolerance > 0: return (round(x/tolerance),round(y/tolerance),round(z/tolerance))
+        return (x,y,z)
+
+    keys = []
+    for group in groups:
+        group = group.group
+        count = group.triangle_count
+        indices = array('H')
+        indices.frombytes(buffer[group.vertex_index_offset:group.vertex_index_offset + 6*count])
+        ColParameters = array('H')
+        if group.has_ColParameter:
+            ColParameters.frombytes(buffer[group.ColParameter_offset:group.ColParameter_offset + 2*count])
+        if sys.byteorder == 'little':
+            indices.byteswap()
+            ColParameters.byteswap()
+        TerrainTypes = buffer[group.TerrainType_offset:group.TerrainType_offset + count].tolist()
+        unknowns = buffer[group.unknown_offset:group.unknown_offset + count].tolist()
+
+        for i in range(count):
+            a,b,c = point(indices[3*i]),point(indices[3*i + 1]),point(indices[3*i + 2])
+            geometry = min((a,b,c),(b,c,a),(c,a,b)) #same triangle whichever corner it starts at, winding is kept
+            attributes = (TerrainTypes[i],unknowns[i],ColParameters[i] if group.has_ColParameter else None)
+            keys.append((geometry,attributes))
+    return keys
+
+
+def diff_group(old_keys,new_keys,result):
+    unmatched = {} #geometry -> old triangles not matched yet
+    for i,(geometry,attributes) in enumerate(old_keys):
+        unmatched.setdefault(geometry,[]).append((i,attributes))
+
+    changed_attributes = []
+    for i,(geometry,attributes) in enumerate(new_keys):
+        candidates = unmatched.get(geometry)
+        if not candidates:
+            result.added.append(i)
+            continue
+        for n,(j,old_attributes) in enumerate(candidates): #prefer an exact match
+            if old_attributes == attributes:
+                del candidates[n]
+                break
+        else:
+            changed_attributes.append((candidates.pop(0),i,attributes))
+
+    for (j,old_attributes),i,attributes in changed_attributes:
+        changes = {name:(old,new) for name,old,new in zip(('TerrainType','unknown','ColParameter'),old_attributes,attributes) if old != new}
+        result.modified.append((j,i,changes))
+    for candidates in unmatched.values():
+        result.removed.extend(j for j,_ in candidates)
+    result.removed.sort()
+    if result.added or result.removed or result.modified:
+        result.status = 'changed'
+
+
+def groups_by_key(view): #groups of a view by (CollisionType,has_ColParameter), large groups are split over several
+    groups = {}
+    for group in view.groups:
+        groups.setdefault((group.CollisionType,group.has_ColParameter),[]).append(group)
+    return groups
+
+
+def diff_col(old_view,new_view,tolerance=0.0):
+    """Compare two COLViews group by group.
+
+    Groups are matched on (CollisionType,has_ColParameter), groups sharing a
+    key are compared as one. A group whose sections hash the same, in files
+    with equivalent vertex data, is skipped without decoding. Other groups are
+    compared triangle by triangle on canonical geometry keys, so renumbered
+    vertices and rotated triangles do not show up as changes. Vertices that
+    moved no more than tolerance count as unmoved. Triangle indices in the
+    result count through all groups that share a key.
+    """
+    result = COLDiff()
+    result.old_vertex_count = old_view.header.vertex_count
+    result.new_vertex_count = new_view.header.vertex_count
+
+    old_vertex_data = old_view.buffer[old_view.header.vertex_offset:old_view.header.vertex_offset + 12*old_view.header.vertex_count]
+    new_vertex_data = new_view.buffer[new_view.header.vertex_offset:new_view.header.vertex_offset + 12*new_view.header.vertex_count]
+    same_vertices = old_vertex_data == new_vertex_data
+    old_positions = new_positions = None
+    if not same_vertices:
+        old_positions = read_positions(old_view)
+        new_positions = read_positions(new_view)
+        limit = tolerance*tolerance
+        for i in range(min(result.old_vertex_count,result.new_vertex_count)):
+            old = old_positions[3*i:3*i + 3]
+            new = new_positions[3*i:3*i + 3]
+            if old != new and (old[0] - new[0])**2 + (old[1] - new[1])**2 + (old[2] - new[2])**2 > limit:
+                result.moved_vertices.append((i,tuple(old),tuple(new)))
+
+    #with equivalent vertices, identical index and attribute bytes mean an identical group
+    equivalent_vertices = same_vertices or (result.old_vertex_count == result.new_vertex_count and not result.moved_vertices)
+
+    old_groups = groups_by_key(old_view)
+    new_groups = groups_by_key(new_view)
+    for key in list(old_groups) + [key for key in new_groups if key not in old_groups]:
+        old = old_groups.get(key,[])
+        new = new_groups.get(key,[])
+        old_count = sum(len(group) for group in old)
+        new_count = sum(len(group) for group in new)
+        if not new:
+            group_diff = GroupDiff(key,'removed',old_count,0)
+            group_diff.removed = list(range(old_count))
+        elif not old:
+            group_diff = GroupDiff(key,'added',0,new_count)
+            group_diff.added = list(range(new_count))
+        else:
+            group_diff = GroupDiff(key,'unchanged',old_count,new_count)
+            if not (equivalent_vertices and [len(group) for group in old] == [len(group) for group in new] and
+                    [group_section_hashes(old_view,group) for group in old] == [group_section_hashes(new_view,group) for group in new]):
+                if old_positions is None:
+                    old_positions = read_positions(old_view)
+                    new_positions = old_positions if same_vertices else read_positions(new_view)
+                diff_group(group_triangle_keys(old_view,old,old_positions,tolerance),group_triangle_keys(new_view,new,new_positions,tolerance),group_diff)
+        result.groups.append(group_diff)
+
+    return result
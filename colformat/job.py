@@ -0,0 +1,163 @@
+import io
+import os
+import threading
+from colformat import yaz0
+from colformat.codec import pack
+from colformat.mesh import weld_vertices,reorder_spatially
+from colformat.simplify import merge_coplanar
+from colformat.stats import null_stats
+from colformat.validation import validate
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class ExportJob:
+    """The CPU heavy part of an export, after the meshes have been extracted.
+
+    Welds, merges coplanar triangles, reorders, validates, packs and
+    optionally Yaz0 compresses the given vertices and triangles, then writes
+    the file. run() does the work on the calling thread, start() runs it
+    on a worker thread. The other methods may be called from any thread while
+    the job runs: progress() for a (fraction,phase) snapshot, cancel() to stop
+    at the next checkpoint. The target file is only replaced once the whole
+    file has been written, so a cancelled or failed job leaves it untouched.
+    """
+
+    write_chunk_size = 1 << 20
+
+    def __init__(self,path,vertices,triangles,weld=False,weld_distance=0.0,merge=False,merge_tolerance=0.01,spatial_order=None,check=True,yaz0_level=None,stats=null_stats):
+        self.path = path
+        self.vertices = vertices
+        self.triangles = triangles
+        self.weld = weld
+        self.weld_distance = weld_distance
+        self.merge = merge
+        self.merge_tolerance = merge_tolerance
+        self.spatial_order = spatial_order #None, 'morton' or 'hilbert'
+        self.check = check
+        self.yaz0_level = yaz0_level #None for an uncompressed file
+        self.stats = stats
+        self.phases = [phase for phase,enabled in (('weld',weld),('merge',merge),('reorder',spatial_order is not None),('validate',check)) if enabled] + ['pack'] + (['compress'] if yaz0_level is not None else []) + ['write']
+
+        self.lock = threading.Lock()
+        self.cancel_requested = threading.Event()
+        self.finished = threading.Event()
+        self.thread = None
+        self.state = 'pending' #pending, running, finished, failed or cancelled
+        self.phase = None
+        self.fraction = 0.0
+        self.messages = [] #(level,text) pairs for the operator report, level is 'INFO' or 'WARNING'
+        self.error = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run,name='COL export',daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        self.cancel_requested.set()
+
+    def wait(self,timeout=None): #True once the job is done
+        return self.finished.wait(timeout)
+
+    @property
+    def done(self):
+        return self.finished.is_set()
+
+    def progress(self):
+        with self.lock:
+            return self.fraction,self.phase
+
+    def run(self):
+        with self.lock:
+            self.state = 'running'
+        try:
+            self.export()
+            state = 'finished'
+        except JobCancelled:
+            state = 'cancelled'
+        except Exception as error:
+            if self.error is None: self.error = '{}: {}'.format(type(error).__name__,error)
+            state = 'failed'
+        with self.lock:
+            self.state = state
+            if state == 'finished': self.fraction = 1.0
+        self.finished.set()
+
+    def export(self):
+        stats = self.stats
+        vertices,triangles = self.vertices,self.triangles
+
+        if self.weld:
+            self.enter('weld')
+            with stats.phase('weld'):
+                vertices,removed = weld_vertices(vertices,triangles,self.weld_distance)
+            stats.count('welded vertices',removed)
+            self.message('INFO','Welded away {} vertices'.format(removed))
+
+        if self.merge:
+            self.enter('merge')
+            with stats.phase('merge'):
+                vertices,triangles,removed = merge_coplanar(vertices,triangles,self.merge_tolerance)
+            stats.count('merged triangles',removed)
+            self.message('INFO','Merged coplanar triangles, removed {} triangles'.format(removed))
+
+        if self.spatial_order is not None:
+            self.enter('reorder')
+            with stats.phase('reorder'):
+                vertices,triangles = reorder_spatially(vertices,triangles,self.spatial_order)
+
+        if self.check:
+            self.enter('validate')
+            with stats.phase('validate'):
+                report = validate(vertices,triangles)
+            if report.errors:
+                self.error = 'Can not export: ' + report.summary()
+                raise ValueError(self.error)
+            if not report.ok:
+                self.message('WARNING',report.summary())
+
+        self.enter('pack')
+        data = io.BytesIO()
+        pack(data,vertices,triangles,stats=stats)
+        data = data.getbuffer()
+
+        if self.yaz0_level is not None:
+            self.enter('compress')
+            with stats.phase('compress'):
+                compressed = yaz0.compress(data,self.yaz0_level)
+            data.release()
+            data = memoryview(compressed)
+
+        self.enter('write')
+        temporary_path = self.path + '.tmp'
+        try:
+            with stats.phase('write'),open(temporary_path,'wb') as stream:
+                for offset in range(0,len(data),self.write_chunk_size):
+                    self.checkpoint(offset/len(data))
+                    stream.write(data[offset:offset + self.write_chunk_size])
+            self.checkpoint(1.0)
+            os.replace(temporary_path,self.path)
+        except BaseException:
+            if os.path.exists(temporary_path): os.remove(temporary_path)
+            raise
+        finally:
+            data.release()
+
+    def enter(self,phase): #start the next phase, updates the progress and checks for cancellation
+        with self.lock:
+            self.phase = phase
+            self.fraction = self.phases.index(phase)/len(self.phases)
+        self.checkpoint()
+
+    def checkpoint(self,phase_fraction=None): #raises JobCancelled when cancel() was called, optionally advances the progress within the current phase
+        if self.cancel_requested.is_set():
+            raise JobCancelled()
+        if phase_fraction is not None:
+            with self.lock:
+                self.fraction = (self.phases.index(self.phase) + phase_fraction)/len(self.phases)
+
+    def message(self,level,text):
+        with self.lock:
+            self.messages.append((level,text))
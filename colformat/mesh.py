@@ -0,0 +1,213 @@
+from colformat.structs import Vertex,Triangle,group_key
+
+
+def weld_vertices(vertices,triangles,epsilon=0.0): #merge vertices closer than epsilon, triangles are remapped in place
+    welded = []
+    remap = []
+    if epsilon <= 0: #exact duplicates only
+        lookup = {}
+        for vertex in vertices:
+            position = (vertex.x,vertex.y,vertex.z)
+            index = lookup.get(position)
+            if index is None:
+                index = lookup[position] = len(welded)
+                welded.append(vertex)
+            remap.append(index)
+    else: #spatial hash grid with cells of size epsilon, a match can only be in a neighbouring cell
+        grid = {}
+        epsilon_squared = epsilon*epsilon
+        neighbours = [(i,j,k) for i in (-1,0,1) for j in (-1,0,1) for k in (-1,0,1)]
+        for vertex in vertices:
+            x,y,z = vertex.x,vertex.y,vertex.z
+            cx,cy,cz = int(x//epsilon),int(y//epsilon),int(z//epsilon)
+            match = None
+            for i,j,k in neighbours:
+                for index in grid.get((cx + i,cy + j,cz + k),()):
+                    other = welded[index]
+                    if (other.x - x)**2 + (other.y - y)**2 + (other.z - z)**2 <= epsilon_squared:
+                        match = index
+                        break
+                if match is not None: break
+            if match is None:
+                match = len(welded)
+                welded.append(vertex)
+                grid.setdefault((cx,cy,cz),[]).append(match)
+            remap.append(match)
+
+    for triangle in triangles:
+        triangle.vertex_indices = [remap[index] for index in triangle.vertex_indices]
+
+    return welded,len(vertices) - len(welded)
+
+
+def spread_bits(v): #put two zero bits between each of the low 21 bits of v
+    v &= 0x1FFFFF
+    v = (v | v << 32) & 0x1F00000000FFFF
+    v = (v | v << 16) & 0x1F0000FF0000FF
+    v = (v | v << 8) & 0x100F00F00F00F00F
+    v = (v | v << 4) & 0x10C30C30C30C30C3
+    v = (v | v << 2) & 0x1249249249249249
+    return v
+
+
+def morton_code(x,y,z,bits): #position along the Z-order curve of integer coordinates
+    return spread_bits(x) << 2 | spread_bits(y) << 1 | spread_bits(z)
+
+
+def hilbert_code(x,y,z,bits): #position along the Hilbert curve, from Skilling's "Programming the Hilbert curve"
+    X = [x,y,z]
+    Q = 1 << (bits - 1)
+    while Q > 1: #inverse undo excess work
+        P = Q - 1
+        for i in range(3):
+            if X[i] & Q:
+                X[0] ^= P
+            else:
+                t = (X[0] ^ X[i]) & P
+                X[0] ^= t
+                X[i] ^= t
+        Q >>= 1
+    X[1] ^= X[0] #Gray encode
+    X[2] ^= X[1]
+    t = 0
+    Q = 1 << (bits - 1)
+    while Q > 1:
+        if X[2] & Q: t ^= Q - 1
+        Q >>= 1
+    return morton_code(X[0] ^ t,X[1] ^ t,X[2] ^ t,bits) #the transposed index is the interleaved bits
+
+
+SPACE_FILLING_CURVES = {'morton':morton_code,'hilbert':hilbert_code}
+
+
+def reorder_spatially(vertices,triangles,curve='morton',key=group_key,bits=10):
+    """Sort triangles within each group along a space filling curve of their centroids
+    and renumber vertices in the order pack() will first reference them.
+
+    Groups keep their first-seen order, so the grouping pack() does is
+    unchanged. Unused vertices are kept at the end. Triangles are remapped in
+    place, the reordered vertex and triangle lists are returned.
+    """
+    code = SPACE_FILLING_CURVES[curve]
+    if not triangles: return list(vertices),list(triangles)
+
+    centroids = []
+    for triangle in triangles:
+        a,b,c = (vertices[index] for index in triangle.vertex_indices[:3])
+        centroids.append(((a.x + b.x + c.x)/3,(a.y + b.y + c.y)/3,(a.z + b.z + c.z)/3))
+    low = [min(centroid[axis] for centroid in centroids) for axis in range(3)]
+    high = [max(centroid[axis] for centroid in centroids) for axis in range(3)]
+    cells = (1 << bits) - 1
+    scale = [cells/(high[axis] - low[axis]) if high[axis] > low[axis] else 0 for axis in range(3)]
+
+    ranks = {} #group key -> first seen order
+    sort_keys = []
+    for triangle,(x,y,z) in zip(triangles,centroids):
+        rank = ranks.setdefault(key(triangle),len(ranks))
+        sort_keys.append((rank,code(int((x - low[0])*scale[0]),int((y - low[1])*scale[1]),int((z - low[2])*scale[2]),bits)))
+    order = sorted(range(len(triangles)),key=sort_keys.__getitem__)
+    reordered = [triangles[i] for i in order]
+
+    #pack() writes groups in order, so this is the order in which the file uses vertices
+    remap = [-1]*len(vertices)
+    new_vertices = []
+    for triangle in sorted(reordered,key=lambda triangle: ranks[key(triangle)]):
+        for index in triangle.vertex_indices:
+            if remap[index] < 0:
+                remap[index] = len(new_vertices)
+                new_vertices.append(vertices[index])
+    for index,vertex in enumerate(vertices):
+        if remap[index] < 0:
+            remap[index] = len(new_vertices)
+            new_vertices.append(vertex)
+
+    for triangle in reordered:
+        triangle.vertex_indices = [remap[index] for index in triangle.vertex_indices]
+    return new_vertices,reordered
+
+
+def material_key(triangle): #collision values that decide which material a triangle gets
+    return (triangle.ColType,triangle.TerrainType,triangle.unknown,triangle.ColParameter)
+
+
+def plan_import(vertices,triangles): #work out the mesh data for an import without touching blender
+    Coordinates = [(v.x,-v.z,v.y) for v in vertices] #make sure z is up
+    Faces = []
+    MaterialKeys = []
+    MaterialIndices = []
+    MaterialLookup = {} #material key -> material index
+    SeenFaces = set()
+    VertexCount = len(vertices)
+    for f in triangles:
+        Face = tuple(f.vertex_indices[:3])
+        FaceKey = tuple(sorted(Face))
+        if FaceKey in SeenFaces: continue #blender rejects duplicate faces, whatever their winding
+        if FaceKey[0] == FaceKey[1] or FaceKey[1] == FaceKey[2]: continue #and faces that use a vertex twice
+        if FaceKey[0] < 0 or FaceKey[2] >= VertexCount: continue #and faces pointing at missing vertices
+        SeenFaces.add(FaceKey)
+
+        Key = material_key(f)
+        MaterialIndex = MaterialLookup.get(Key)
+        if MaterialIndex is None: #We did not find a material that matched
+            MaterialIndex = len(MaterialKeys)
+            MaterialLookup[Key] = MaterialIndex
+            MaterialKeys.append(Key)
+        Faces.append(Face)
+        MaterialIndices.append(MaterialIndex)
+    return Coordinates,Faces,MaterialKeys,MaterialIndices
+
+
+def col_space_transform(matrix,scale):
+    """3x4 affine transform from object space to COL space.
+
+    matrix is the object's 4x4 world matrix as a sequence of rows. The result
+    applies it, then swaps the axes so y is up and scales, in one step.
+    """
+    x,y,z = ([float(value) for value in row] for row in list(matrix)[:3])
+    return [[scale*value for value in x],[scale*value for value in z],[-scale*value for value in y]]
+
+
+def determinant(transform): #of the 3x3 linear part of a 3x4 transform
+    (a,b,c,_),(d,e,f,_),(g,h,i,_) = transform
+    return a*(e*i - f*h) - b*(d*i - f*g) + c*(d*h - e*g)
+
+
+def transform_vertices(coordinates,transform): #Vertex list from flat object space x,y,z coordinates
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None:
+        points = numpy.asarray(coordinates,dtype=numpy.float64).reshape(-1,3)
+        transform = numpy.array(transform,dtype=numpy.float64)
+        points = points @ transform[:,:3].T + transform[:,3]
+        return [Vertex(x,y,z) for x,y,z in points.tolist()]
+    (a,b,c,d),(e,f,g,h),(i,j,k,l) = transform
+    values = iter(coordinates)
+    return [Vertex(a*x + b*y + c*z + d,e*x + f*y + g*z + h,i*x + j*y + k*z + l) for x,y,z in zip(values,values,values)]
+
+
+def mesh_block(coordinates,triangle_vertices,material_indices,materials,matrix,scale):
+    """(vertices,triangles) block of a triangulated mesh, in COL space.
+
+    coordinates are the flat object space vertex coordinates and
+    triangle_vertices the flat vertex indices, three per triangle, as read with
+    foreach_get. materials holds the material_key of each material slot, or
+    None for slots without a material. Indices start at 0, rebase_blocks
+    shifts them when the blocks of several objects are combined. A mirroring
+    matrix (negative determinant) turns the triangles inside out, so their
+    winding is reversed to keep the normals pointing the same way.
+    """
+    transform = col_space_transform(matrix,scale)
+    vertices = transform_vertices(coordinates,transform)
+    mirrored = determinant(transform) < 0
+    default = (0,0,0,None)
+    triangles = []
+    values = iter(triangle_vertices)
+    for a,b,c,material_index in zip(values,values,values,material_indices):
+        triangle = Triangle()
+        triangle.vertex_indices = [a,c,b] if mirrored else [a,b,c]
+        key = materials[material_index] if material_index < len(materials) else None
+        triangle.ColType,triangle.TerrainType,triangle.unknown,triangle.ColParameter = key if key is not None else default
+        triangles.append(triangle)
+    return vertices,triangles
@@ -0,0 +1,225 @@
+from collections import deque
+from math import atan2,pi,sqrt
+from colformat.mesh import material_key
+from colformat.structs import Triangle
+
+
+def triangle_plane(a,b,c): #unit normal and offset of the plane through three vertices, None if they are collinear
+    ux,uy,uz = b.x - a.x,b.y - a.y,b.z - a.z
+    vx,vy,vz = c.x - a.x,c.y - a.y,c.z - a.z
+    nx,ny,nz = uy*vz - uz*vy,uz*vx - ux*vz,ux*vy - uy*vx
+    length = sqrt(nx*nx + ny*ny + nz*nz)
+    if length <= 1e-9*(ux*ux + uy*uy + uz*uz + vx*vx + vy*vy + vz*vz): return None
+    nx,ny,nz = nx/length,ny/length,nz/length
+    return (nx,ny,nz),nx*a.x + ny*a.y + nz*a.z
+
+
+def planar_regions(vertices,corners,keys,tolerance):
+    """Label triangles with the index of the seed triangle of their coplanar region.
+
+    Regions grow across shared edges from a seed triangle. A neighbour joins
+    when it has the same collision values, faces the same way and all its
+    vertices are within tolerance of the seed's plane. Measuring against the
+    seed keeps a gently curved surface from being flattened step by step.
+    Degenerate triangles and the ones given as None get -1. Returns the
+    labels and the triangle planes.
+    """
+    planes = [triangle_plane(*(vertices[index] for index in triangle)) if triangle is not None else None for triangle in corners]
+    edges = {} #undirected edge -> triangles using it
+    for i,triangle in enumerate(corners):
+        if planes[i] is None: continue
+        a,b,c = triangle
+        for edge in ((a,b),(b,c),(c,a)):
+            edges.setdefault((min(edge),max(edge)),[]).append(i)
+
+    regions = [-1]*len(corners)
+    for seed in range(len(corners)):
+        if regions[seed] != -1 or planes[seed] is None: continue
+        regions[seed] = seed
+        (nx,ny,nz),offset = planes[seed]
+        stack = [seed]
+        while stack:
+            a,b,c = corners[stack.pop()]
+            for edge in ((a,b),(b,c),(c,a)):
+                for other in edges[(min(edge),max(edge))]:
+                    if regions[other] != -1 or keys[other] != keys[seed]: continue
+                    (ox,oy,oz),_ = planes[other]
+                    if ox*nx + oy*ny + oz*nz <= 0: continue
+                    if any(abs(nx*vertex.x + ny*vertex.y + nz*vertex.z - offset) > tolerance for vertex in (vertices[index] for index in corners[other])): continue
+                    regions[other] = seed
+                    stack.append(other)
+    return regions,planes
+
+
+def projector(normal): #2d coordinates in a plane with the given normal, counter clockwise seen from the front
+    nx,ny,nz = normal
+    axis = max(range(3),key=lambda axis: abs(normal[axis]))
+    if axis == 0: return (lambda v: (v.y,v.z)) if nx > 0 else (lambda v: (v.z,v.y))
+    if axis == 1: return (lambda v: (v.z,v.x)) if ny > 0 else (lambda v: (v.x,v.z))
+    return (lambda v: (v.x,v.y)) if nz > 0 else (lambda v: (v.y,v.x))
+
+
+def cross(o,a,b):
+    return (a[0] - o[0])*(b[1] - o[1]) - (a[1] - o[1])*(b[0] - o[0])
+
+
+def triangulate_polygon(points):
+    """Ear clipping of a simple counter clockwise polygon of 2d points.
+
+    Returns index triples, or None when no ear without a degenerate triangle
+    can be found, for example because the polygon is not simple.
+    """
+    indices = list(range(len(points)))
+    triangles = []
+    while len(indices) >= 3:
+        for k in range(len(indices)):
+            i,j,l = indices[k - 1],indices[k],indices[(k + 1) % len(indices)]
+            a,b,c = points[i],points[j],points[l]
+            area = cross(a,b,c)
+            if area <= 1e-9*((b[0] - a[0])**2 + (b[1] - a[1])**2 + (c[0] - b[0])**2 + (c[1] - b[1])**2): continue #reflex or degenerate
+            if any(cross(a,b,p) >= 0 and cross(b,c,p) >= 0 and cross(c,a,p) >= 0 for p in (points[m] for m in indices if m != i and m != j and m != l)): continue
+            triangles.append((i,j,l))
+            del indices[k]
+            break
+        else:
+            return None
+        if len(indices) == 2: return triangles
+    return None
+
+
+def merge_coplanar(vertices,triangles,tolerance=0.01,max_ring=64):
+    """Merge adjacent coplanar triangles with the same collision values.
+
+    Removes every vertex whose surrounding triangles all lie in one planar
+    region (see planar_regions) and retriangulates the hole, so flat areas
+    end up with as few triangles as their outline allows. Vertices on the
+    outline of a region are shared with other triangles and are kept, which
+    keeps the mesh free of T-junctions and cracks. A vertex on the open
+    border of the mesh goes when it is on the straight line between its
+    neighbours. Uses an edge map and per-vertex triangle fans, so the time is
+    about linear in the size of the mesh. max_ring bounds the size of the
+    holes that are retriangulated.
+
+    Returns the new vertex and triangle lists and the number of triangles
+    removed. Removed vertices are dropped and the other vertices keep their
+    order, the triangles that are kept are remapped in place.
+    """
+    corners = [list(triangle.vertex_indices[:3]) for triangle in triangles]
+    sources = list(triangles) #the original triangle each triangle takes its collision values from
+    keys = [material_key(triangle) for triangle in triangles]
+    valid = [len(set(triangle)) == 3 and 0 <= min(triangle) and max(triangle) < len(vertices) for triangle in corners]
+    regions,planes = planar_regions(vertices,[triangle if ok else None for triangle,ok in zip(corners,valid)],keys,tolerance)
+
+    alive = [True]*len(corners)
+    fans = [set() for _ in vertices] #vertex -> live triangles using it, invalid triangles are in region -1 and pin their vertices
+    for i,triangle in enumerate(corners):
+        for index in triangle:
+            if 0 <= index < len(vertices): fans[index].add(i)
+
+    removed = [False]*len(vertices)
+    queue = deque(index for index in range(len(vertices)) if fans[index])
+    queued = [bool(fans[index]) for index in range(len(vertices))]
+    while queue:
+        vertex = queue.popleft()
+        queued[vertex] = False
+        ring = remove_vertex(vertex,vertices,corners,regions,planes,fans[vertex],tolerance,max_ring)
+        if ring is None: continue
+        ring,new_triangles = ring
+
+        fan = fans[vertex]
+        region = regions[next(iter(fan))]
+        source = sources[next(iter(fan))]
+        for i in fan:
+            alive[i] = False
+            for index in corners[i]:
+                if index != vertex: fans[index].discard(i)
+        fan.clear()
+        removed[vertex] = True
+        for triangle in new_triangles:
+            corners.append(triangle)
+            sources.append(source)
+            regions.append(region)
+            alive.append(True)
+            for index in triangle:
+                fans[index].add(len(corners) - 1)
+        for index in ring:
+            if not queued[index]:
+                queued[index] = True
+                queue.append(index)
+
+    remap = []
+    new_vertices = []
+    for index,vertex in enumerate(vertices):
+        remap.append(len(new_vertices))
+        if not removed[index]: new_vertices.append(vertex)
+
+    new_triangles = []
+    for i,triangle in enumerate(corners):
+        if not alive[i]: continue
+        if i < len(triangles):
+            merged = triangles[i]
+            merged.vertex_indices = [remap[index] if 0 <= index < len(vertices) else index for index in triangle]
+        else:
+            source = sources[i]
+            merged = Triangle()
+            merged.vertex_indices = [remap[index] for index in triangle]
+            merged.ColType,merged.TerrainType,merged.unknown,merged.ColParameter = material_key(source)
+        new_triangles.append(merged)
+    return new_vertices,new_triangles,len(triangles) - len(new_triangles)
+
+
+def remove_vertex(vertex,vertices,corners,regions,planes,fan,tolerance,max_ring):
+    """Retriangulation of the fan around a vertex without that vertex.
+
+    Returns (ring,triangles) with the ring of neighbouring vertices and the
+    new triangles as vertex index triples, or None if the vertex has to stay.
+    """
+    if len(fan) < 2 or len(fan) > max_ring: return None
+    region = regions[next(iter(fan))]
+    if region == -1 or any(regions[i] != region for i in fan): return None
+
+    following = {} #ring edges, oriented like the triangles
+    for i in fan:
+        a,b,c = corners[i]
+        start,end = (b,c) if a == vertex else (c,a) if b == vertex else (a,b)
+        if start in following: return None #not a manifold fan
+        following[start] = end
+    starts = set(following) - set(following.values())
+    if len(starts) > 1: return None
+    closed = not starts
+    ring = [next(iter(following)) if closed else starts.pop()]
+    for _ in fan:
+        if ring[-1] not in following: break
+        ring.append(following[ring[-1]])
+    if len(ring) != len(fan) + 1: return None
+    if closed: #an interior vertex, the ring has to go around it once
+        if ring.pop() != ring[0]: return None
+    elif not on_segment(vertices[vertex],vertices[ring[0]],vertices[ring[-1]],tolerance):
+        return None #a vertex on the border of the mesh, it has to lie on the line between its two border neighbours
+    if len(set(ring)) != len(ring): return None
+
+    #the fan must not fold over itself: every triangle turns the same way and together they go around once, or half way for a border vertex
+    project = projector(planes[region][0])
+    points = [project(vertices[index]) for index in ring]
+    cx,cy = project(vertices[vertex])
+    angle = 0.0
+    for (ax,ay),(bx,by) in zip(points,points[1:] + points[:1] if closed else points[1:]):
+        ax,ay,bx,by = ax - cx,ay - cy,bx - cx,by - cy
+        turn = atan2(ax*by - ay*bx,ax*bx + ay*by)
+        if turn <= 0: return None
+        angle += turn
+    if abs(angle - (2*pi if closed else pi)) > 1e-6: return None
+
+    triangles = triangulate_polygon(points)
+    if triangles is None: return None
+    return ring,[[ring[i],ring[j],ring[k]] for i,j,k in triangles]
+
+
+def on_segment(point,a,b,tolerance): #point is within tolerance of the segment between a and b, and not at either end
+    dx,dy,dz = b.x - a.x,b.y - a.y,b.z - a.z
+    length_squared = dx*dx + dy*dy + dz*dz
+    if length_squared == 0: return False
+    t = ((point.x - a.x)*dx + (point.y - a.y)*dy + (point.z - a.z)*dz)/length_squared
+    if not 0 < t < 1: return False
+    ex,ey,ez = a.x + t*dx - point.x,a.y + t*dy - point.y,a.z + t*dz - point.z
+    return ex*ex + ey*ey + ez*ez <= tolerance*tolerance
@@ -0,0 +1,58 @@
+import time
+
+
+class Stats:
+    """Per-phase wall times and counters collected during an import or export."""
+
+    def __init__(self):
+        self.phases = {} #phase name -> seconds, in the order phases first ran
+        self.counters = {}
+
+    def phase(self,name):
+        return PhaseTimer(self,name)
+
+    def count(self,name,value):
+        self.counters[name] = self.counters.get(name,0) + value
+
+    def report(self):
+        lines = ['{}: {:.3f}s'.format(name,seconds) for name,seconds in self.phases.items()]
+        lines += ['{}: {}'.format(name,value) for name,value in self.counters.items()]
+        return '\n'.join(lines)
+
+    def to_json(self):
+        import json #only needed for reports, keep it off the import path
+        return json.dumps({'phases':self.phases,'counters':self.counters},indent=2)
+
+
+class PhaseTimer:
+
+    def __init__(self,stats,name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self,*args):
+        phases = self.stats.phases
+        phases[self.name] = phases.get(self.name,0.0) + time.perf_counter() - self.start
+
+
+class NullStats:
+    """Stand-in for Stats when instrumentation is off, every call is a no-op."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        pass
+
+    def phase(self,name):
+        return self
+
+    def count(self,name,value):
+        pass
+
+
+null_stats = NullStats()
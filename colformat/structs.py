@@ -0,0 +1,56 @@
+from btypes.big_endian import *
+
+
+class Header(Struct):
+    vertex_count = uint32
+    vertex_offset = uint32
+    group_count = uint32
+    group_offset = uint32
+
+
+class Vertex(Struct):
+    __slots__ = ('x','y','z') #no per-vertex dict, stages have a lot of these
+    x = float32
+    y = float32
+    z = float32
+
+    def __init__(self,x,y,z):
+        self.x = x
+        self.y = y
+        self.z = z
+
+
+class Group(Struct):
+    CollisionType = uint16 #Properties of collision. e.g. is it water? or what?
+    triangle_count = uint16
+    
+    __padding__ = Padding(1,b'\x00') #Group flags, set them to 0 here
+    has_ColParameter = bool8 #Set 0x0001 to 1 if we have ColParameter values so the game doesn't ignore it
+    __padding__ = Padding(2)#Actual padding
+    vertex_index_offset = uint32
+    TerrainType_offset = uint32 # 0-18,20,21,23,24,27-31
+    unknown_offset = uint32 # 0-27
+    ColParameter_offset = uint32 # 0,1,2,3,4,8,255,6000,7500,7800,8000,8400,9000,10000,10300,12000,14000,17000,19000,20000,21000,22000,27500,30300
+
+
+class Triangle:
+
+    __slots__ = ('vertex_indices','ColType','TerrainType','unknown','ColParameter')
+
+    def __init__(self):
+        self.vertex_indices = None
+        self.ColType = 0
+        self.TerrainType = 0
+        self.unknown = 0
+        self.ColParameter = None
+
+    @property
+    def has_ColParameter(self):
+        return self.ColParameter is not None
+
+
+MAX_GROUP_SIZE = 0xFFFF #Group.triangle_count is uint16
+
+
+def group_key(triangle): #default grouping key, triangles in a group share ColType and whether they have a ColParameter
+    return (triangle.ColType,triangle.has_ColParameter)
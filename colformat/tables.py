@@ -0,0 +1,234 @@
+import sys
+from array import array
+from colformat.structs import Vertex,Triangle
+
+
+class VertexRow:
+    """View of one vertex in a VertexTable, reads and writes go to the table."""
+
+    __slots__ = ('table','index')
+
+    def __init__(self,table,index):
+        self.table = table
+        self.index = index
+
+    @property
+    def x(self):
+        return self.table.coordinates[3*self.index]
+
+    @x.setter
+    def x(self,value):
+        self.table.coordinates[3*self.index] = value
+
+    @property
+    def y(self):
+        return self.table.coordinates[3*self.index + 1]
+
+    @y.setter
+    def y(self,value):
+        self.table.coordinates[3*self.index + 1] = value
+
+    @property
+    def z(self):
+        return self.table.coordinates[3*self.index + 2]
+
+    @z.setter
+    def z(self,value):
+        self.table.coordinates[3*self.index + 2] = value
+
+    def __eq__(self,other):
+        return (self.x,self.y,self.z) == (other.x,other.y,other.z)
+
+
+class VertexTable:
+    """Vertices stored as one flat array('f') of x,y,z coordinates.
+
+    Coordinates are float32 like in the file, 12 bytes per vertex instead of
+    a Vertex object each. Indexing and iterating give VertexRow views.
+    """
+
+    def __init__(self,coordinates=()):
+        self.coordinates = array('f',coordinates)
+        if len(self.coordinates) % 3:
+            raise ValueError('coordinates must come in x,y,z triples')
+
+    @classmethod
+    def from_objects(cls,vertices): #anything with x,y,z attributes
+        return cls([value for vertex in vertices for value in (vertex.x,vertex.y,vertex.z)])
+
+    def to_objects(self):
+        values = iter(self.coordinates)
+        return [Vertex(x,y,z) for x,y,z in zip(values,values,values)]
+
+    def __len__(self):
+        return len(self.coordinates)//3
+
+    def __getitem__(self,index):
+        if index < 0: index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('vertex index out of range')
+        return VertexRow(self,index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield VertexRow(self,index)
+
+    def append(self,x,y,z): #returns the index of the new vertex
+        self.coordinates.extend((x,y,z))
+        return len(self) - 1
+
+    @property
+    def nbytes(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.coordinates)
+
+    def numpy(self): #(N,3) float32 array sharing memory with the table
+        import numpy
+        return numpy.frombuffer(self.coordinates,dtype=numpy.float32).reshape(-1,3)
+
+
+class TriangleRow:
+    """View of one triangle in a TriangleTable, with the attributes of a Triangle.
+
+    vertex_indices is read as a tuple, assigning a new sequence updates the
+    table.
+    """
+
+    __slots__ = ('table','index')
+
+    def __init__(self,table,index):
+        self.table = table
+        self.index = index
+
+    @property
+    def vertex_indices(self):
+        start = 3*self.index
+        return tuple(self.table.vertex_indices[start:start + 3])
+
+    @vertex_indices.setter
+    def vertex_indices(self,value):
+        start = 3*self.index
+        self.table.vertex_indices[start:start + 3] = array('i',value[:3])
+
+    @property
+    def ColType(self):
+        return self.table.ColType[self.index]
+
+    @ColType.setter
+    def ColType(self,value):
+        self.table.ColType[self.index] = value
+
+    @property
+    def TerrainType(self):
+        return self.table.TerrainType[self.index]
+
+    @TerrainType.setter
+    def TerrainType(self,value):
+        self.table.TerrainType[self.index] = value
+
+    @property
+    def unknown(self):
+        return self.table.unknown[self.index]
+
+    @unknown.setter
+    def unknown(self,value):
+        self.table.unknown[self.index] = value
+
+    @property
+    def ColParameter(self):
+        return self.table.ColParameter[self.index] if self.table.has_ColParameter[self.index] else None
+
+    @ColParameter.setter
+    def ColParameter(self,value):
+        self.table.has_ColParameter[self.index] = value is not None
+        self.table.ColParameter[self.index] = value if value is not None else 0
+
+    @property
+    def has_ColParameter(self):
+        return bool(self.table.has_ColParameter[self.index])
+
+
+class TriangleTable:
+    """Triangles stored as parallel typed arrays, one entry per triangle.
+
+    vertex_indices is a flat array('i') with three indices per triangle (wider
+    than the uint16 in the file, so validate can still report indices out of
+    range), ColType and ColParameter are array('H'), TerrainType, unknown and
+    has_ColParameter are array('B'). Absent ColParameter values are stored as
+    0. That is 20 bytes per triangle instead of a Triangle object and a list.
+    Indexing and iterating give TriangleRow views, which work with group_key,
+    material_key and validate like Triangle objects do.
+    """
+
+    def __init__(self):
+        self.vertex_indices = array('i')
+        self.ColType = array('H')
+        self.TerrainType = array('B')
+        self.unknown = array('B')
+        self.ColParameter = array('H')
+        self.has_ColParameter = array('B')
+
+    @classmethod
+    def from_objects(cls,triangles): #anything with the attributes of a Triangle
+        table = cls()
+        table.vertex_indices = array('i',[index for triangle in triangles for index in triangle.vertex_indices[:3]])
+        table.ColType = array('H',[triangle.ColType for triangle in triangles])
+        table.TerrainType = array('B',[triangle.TerrainType for triangle in triangles])
+        table.unknown = array('B',[triangle.unknown for triangle in triangles])
+        table.ColParameter = array('H',[triangle.ColParameter or 0 for triangle in triangles])
+        table.has_ColParameter = array('B',[triangle.ColParameter is not None for triangle in triangles])
+        return table
+
+    def to_objects(self):
+        triangles = []
+        indices = iter(self.vertex_indices)
+        rows = zip(zip(indices,indices,indices),self.ColType,self.TerrainType,self.unknown,self.ColParameter,self.has_ColParameter)
+        for vertex_indices,ColType,TerrainType,unknown,ColParameter,has_ColParameter in rows:
+            triangle = Triangle()
+            triangle.vertex_indices = list(vertex_indices)
+            triangle.ColType = ColType
+            triangle.TerrainType = TerrainType
+            triangle.unknown = unknown
+            triangle.ColParameter = ColParameter if has_ColParameter else None
+            triangles.append(triangle)
+        return triangles
+
+    def __len__(self):
+        return len(self.ColType)
+
+    def __getitem__(self,index):
+        if index < 0: index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('triangle index out of range')
+        return TriangleRow(self,index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield TriangleRow(self,index)
+
+    def append(self,vertex_indices,ColType=0,TerrainType=0,unknown=0,ColParameter=None): #returns the index of the new triangle
+        self.vertex_indices.extend(vertex_indices[:3])
+        self.ColType.append(ColType)
+        self.TerrainType.append(TerrainType)
+        self.unknown.append(unknown)
+        self.ColParameter.append(ColParameter if ColParameter is not None else 0)
+        self.has_ColParameter.append(ColParameter is not None)
+        return len(self) - 1
+
+    def columns(self):
+        return (self.vertex_indices,self.ColType,self.TerrainType,self.unknown,self.ColParameter,self.has_ColParameter)
+
+    @property
+    def nbytes(self):
+        return sys.getsizeof(self) + sum(sys.getsizeof(column) for column in self.columns())
+
+    def numpy(self):
+        """NumPy views of the columns, sharing memory with the table.
+
+        Returns a dict with an (M,3) 'vertex_indices' array and one array per
+        attribute, has_ColParameter as bool.
+        """
+        import numpy
+        arrays = {name:numpy.frombuffer(column,dtype=column.typecode) for name,column in zip(('vertex_indices','ColType','TerrainType','unknown','ColParameter','has_ColParameter'),self.columns())}
+        arrays['vertex_indices'] = arrays['vertex_indices'].reshape(-1,3)
+        arrays['has_ColParameter'] = arrays['has_ColParameter'].view(bool)
+        return arrays
@@ -0,0 +1,102 @@
+from math import isfinite,sqrt
+
+
+class Finding:
+    """One problem found by validate(), pointing at a triangle or a vertex."""
+
+    def __init__(self,kind,triangle=None,vertex=None,detail=None):
+        self.kind = kind
+        self.triangle = triangle #triangle index or None
+        self.vertex = vertex #vertex index or None
+        self.detail = detail
+
+    @property
+    def message(self):
+        where = []
+        if self.triangle is not None: where.append('triangle ' + str(self.triangle))
+        if self.vertex is not None: where.append('vertex ' + str(self.vertex))
+        message = self.kind
+        if where: message += ' at ' + ', '.join(where)
+        if self.detail is not None: message += ': ' + str(self.detail)
+        return message
+
+    def to_dict(self):
+        return {'kind':self.kind,'triangle':self.triangle,'vertex':self.vertex,'detail':self.detail}
+
+
+class ValidationReport:
+
+    ERRORS = ('index out of range','too many vertices','invalid coordinate') #these produce a broken or unwritable file
+
+    def __init__(self,findings):
+        self.findings = findings
+
+    def counts(self): #number of findings of each kind
+        counts = {}
+        for finding in self.findings:
+            counts[finding.kind] = counts.get(finding.kind,0) + 1
+        return counts
+
+    @property
+    def errors(self):
+        return [finding for finding in self.findings if finding.kind in self.ERRORS]
+
+    @property
+    def ok(self):
+        return not self.findings
+
+    def summary(self):
+        if self.ok: return 'no problems found'
+        return ', '.join('{} {}'.format(count,kind) for kind,count in self.counts().items())
+
+
+MAX_VERTEX_COUNT = 0x10000 #vertex indices are uint16
+
+
+def validate(vertices,triangles,area_epsilon=0.0): #check a (vertices,triangles) pair for problems in a single pass
+    findings = []
+    vertex_count = len(vertices)
+    if vertex_count > MAX_VERTEX_COUNT:
+        findings.append(Finding('too many vertices',detail='{} vertices, at most {} can be indexed'.format(vertex_count,MAX_VERTEX_COUNT)))
+
+    positions = []
+    for i,vertex in enumerate(vertices):
+        x,y,z = vertex.x,vertex.y,vertex.z
+        if not (isfinite(x) and isfinite(y) and isfinite(z)):
+            findings.append(Finding('invalid coordinate',vertex=i,detail=(x,y,z)))
+        positions.append((x,y,z))
+
+    used = bytearray(vertex_count)
+    seen = {} #canonical triangle key -> first triangle index
+    for i,triangle in enumerate(triangles):
+        a,b,c = triangle.vertex_indices[:3]
+        if not (0 <= a < vertex_count and 0 <= b < vertex_count and 0 <= c < vertex_count):
+            findings.append(Finding('index out of range',triangle=i,detail=(a,b,c)))
+            continue
+        used[a] = used[b] = used[c] = 1
+
+        if a == b or b == c or a == c:
+            findings.append(Finding('degenerate',triangle=i,detail=(a,b,c)))
+            continue
+
+        canonical = (a,b,c) if a < b and a < c else (b,c,a) if b < c else (c,a,b) #same rotation of the winding
+        if canonical[1] > canonical[2]: canonical = (canonical[0],canonical[2],canonical[1]) #and either winding
+        first = seen.get(canonical)
+        if first is not None:
+            findings.append(Finding('duplicate',triangle=i,detail='same vertices as triangle ' + str(first)))
+            continue
+        seen[canonical] = i
+
+        (ax,ay,az),(bx,by,bz),(cx,cy,cz) = positions[a],positions[b],positions[c]
+        ux,uy,uz = bx - ax,by - ay,bz - az
+        vx,vy,vz = cx - ax,cy - ay,cz - az
+        nx,ny,nz = uy*vz - uz*vy,uz*vx - ux*vz,ux*vy - uy*vx
+        area = 0.5*sqrt(nx*nx + ny*ny + nz*nz)
+        if area <= area_epsilon:
+            findings.append(Finding('zero area',triangle=i,detail=area))
+
+    for i in range(vertex_count):
+        if not used[i]:
+            findings.append(Finding('unused vertex',vertex=i))
+
+    return ValidationReport(findings)
@@ -0,0 +1,123 @@
+import mmap
+import struct
+from bisect import bisect_right
+from colformat.structs import Header,Vertex,Group,Triangle
+from colformat import yaz0
+
+
+class GroupView:
+    """Lazy view of the triangles in one group of a COLView, decoded on access."""
+
+    def __init__(self,buffer,group):
+        self.buffer = buffer
+        self.group = group
+
+    @property
+    def CollisionType(self):
+        return self.group.CollisionType
+
+    @property
+    def has_ColParameter(self):
+        return self.group.has_ColParameter
+
+    def __len__(self):
+        return self.group.triangle_count
+
+    def __getitem__(self,index):
+        group = self.group
+        if index < 0: index += group.triangle_count
+        if not 0 <= index < group.triangle_count:
+            raise IndexError('triangle index out of range')
+        triangle = Triangle()
+        triangle.vertex_indices = list(struct.unpack_from('>3H',self.buffer,group.vertex_index_offset + 6*index))
+        triangle.ColType = group.CollisionType
+        triangle.TerrainType = self.buffer[group.TerrainType_offset + index]
+        triangle.unknown = self.buffer[group.unknown_offset + index]
+        if group.has_ColParameter:
+            triangle.ColParameter = struct.unpack_from('>H',self.buffer,group.ColParameter_offset + 2*index)[0]
+        return triangle
+
+    def vertex_indices(self): #zero-copy view of the raw big endian index section
+        return self.buffer[self.group.vertex_index_offset:self.group.vertex_index_offset + 6*self.group.triangle_count]
+
+
+class VertexView:
+    """Lazy view of the vertices of a COLView, decoded on access."""
+
+    def __init__(self,buffer,header):
+        self.buffer = buffer
+        self.header = header
+
+    def __len__(self):
+        return self.header.vertex_count
+
+    def __getitem__(self,index):
+        if index < 0: index += self.header.vertex_count
+        if not 0 <= index < self.header.vertex_count:
+            raise IndexError('vertex index out of range')
+        return Vertex.unpack_from(self.buffer,self.header.vertex_offset + Vertex.sizeof()*index)
+
+
+class TriangleView:
+    """Lazy view of the triangles of all groups of a COLView, in unpack() order."""
+
+    def __init__(self,groups):
+        self.groups = groups
+        self.starts = []
+        count = 0
+        for group in groups:
+            self.starts.append(count)
+            count += len(group)
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self,index):
+        if index < 0: index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('triangle index out of range')
+        i = bisect_right(self.starts,index) - 1 #empty groups share their start with the next group, so this lands on a non-empty one
+        return self.groups[i][index - self.starts[i]]
+
+
+class COLView:
+    """Random access reader for a COL file that decodes only what is touched.
+
+    The header and group table are parsed when the view is created, vertices
+    and triangles are exposed as lazy sequences over the underlying buffer.
+    Use COLView.open to map a file into memory. A Yaz0 compressed file is
+    decompressed into memory first.
+    """
+
+    def __init__(self,buffer):
+        self.mmap = None
+        if yaz0.is_compressed(buffer): buffer = yaz0.decompress(buffer)
+        self.buffer = memoryview(buffer)
+        self.header = Header.unpack_from(self.buffer,0)
+        self.groups = [GroupView(self.buffer,group) for group in Group.unpack_many_from(self.buffer,self.header.group_offset,self.header.group_count)]
+        self.vertices = VertexView(self.buffer,self.header)
+        self.triangles = TriangleView(self.groups)
+
+    @classmethod
+    def open(cls,path):
+        with open(path,'rb') as stream:
+            mapping = mmap.mmap(stream.fileno(),0,access=mmap.ACCESS_READ)
+        view = cls(mapping)
+        if view.buffer.obj is mapping:
+            view.mmap = mapping
+        else: #decompressed, the mapping is not needed any more
+            mapping.close()
+        return view
+
+    def close(self):
+        self.buffer.release()
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
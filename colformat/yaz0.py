@@ -0,0 +1,334 @@
+"""Yaz0 compression, the LZ77 variant Nintendo uses for files in GameCube archives.
+
+A Yaz0 file is a 16 byte header (b'Yaz0', the big endian uint32 size of the
+decompressed data and 8 reserved bytes) followed by groups of a code byte
+and eight tokens. A set code bit, most significant first, means a literal
+byte. A clear bit means a back reference of two bytes NR RR, with the
+distance RRR + 1 up to 4096 bytes back and the length N + 2, or, when N is
+0, of three bytes 0R RR NN with the length NN + 0x12.
+"""
+
+from array import array
+from bisect import bisect_left
+
+
+MAGIC = b'Yaz0'
+HEADER_SIZE = 16
+WINDOW_SIZE = 0x1000
+MIN_MATCH = 3
+MAX_MATCH = 0xFF + 0x12
+HASH_BITS = 16
+MAX_GROUP_SIZE = 1 + 8*3 #code byte and eight three byte back references
+
+#effort level -> (candidates examined per position, longest match whose inner positions are added to the hash chains, lazy matching)
+LEVELS = {
+    0:(0,0,False), #no matching, literals only
+    1:(1,0,False),
+    2:(4,0,False),
+    3:(4,4,False),
+    4:(8,8,False),
+    5:(16,16,False),
+    6:(16,32,False),
+    7:(64,MAX_MATCH,True),
+    8:(256,MAX_MATCH,True),
+    9:(1024,MAX_MATCH,True),
+}
+
+
+def is_compressed(data):
+    return data[:4] == MAGIC
+
+
+def match_length(data,a,b,limit): #length of the common prefix of data[a:] and data[b:], at most limit
+    length = 0
+    while length + 16 <= limit and data[a + length:a + length + 16] == data[b + length:b + length + 16]:
+        length += 16
+    while length < limit and data[a + length] == data[b + length]:
+        length += 1
+    return length
+
+
+def exact_matches(data):
+    """Hash chains without collisions and the nearest matches, built with NumPy in a few vectorized passes.
+
+    Returns two array('i') and a list. The first array holds, for every
+    position, the previous position starting with the same three bytes (-1
+    if there is none), the second the length of the match with that position
+    (0 if it is out of the window). The list holds the positions that have
+    such a match, in order.
+    """
+    import numpy
+    size = len(data)
+    values = numpy.frombuffer(data,dtype=numpy.uint8)
+    keys = values[:-2].astype(numpy.intc) << 16 | values[1:-1].astype(numpy.intc) << 8 | values[2:]
+    order = numpy.argsort(keys,kind='stable').astype(numpy.intc)
+    same = keys[order[1:]] == keys[order[:-1]]
+    links = numpy.full(size,-1,dtype=numpy.intc)
+    links[order[1:][same]] = order[:-1][same]
+
+    positions = numpy.flatnonzero((links >= 0) & (numpy.arange(size) - links <= WINDOW_SIZE))
+    previous = links[positions]
+    lengths = numpy.full(len(positions),MIN_MATCH,dtype=numpy.intc)
+    limits = numpy.minimum(MAX_MATCH,size - positions)
+    words = numpy.ndarray((max(size - 7,0),),dtype=numpy.uint64,buffer=data,strides=(1,)) #the eight bytes at every position
+    active = numpy.flatnonzero(lengths + 8 <= limits)
+    while len(active): #extend all the matches that are still going by eight bytes
+        offsets = lengths[active]
+        active = active[words[positions[active] + offsets] == words[previous[active] + offsets]]
+        lengths[active] += 8
+        active = active[lengths[active] + 8 <= limits[active]]
+    active = numpy.flatnonzero(lengths < limits)
+    while len(active): #then by one byte
+        offsets = lengths[active]
+        active = active[values[positions[active] + offsets] == values[previous[active] + offsets]]
+        lengths[active] += 1
+        active = active[lengths[active] < limits[active]]
+    nearest = numpy.zeros(size,dtype=numpy.intc)
+    nearest[positions] = lengths
+    return array('i',links.tobytes()),array('i',nearest.tobytes()),positions.tolist()
+
+
+def compress(data,level=6):
+    """Yaz0 compress data.
+
+    Matches are found with hash chains over three byte prefixes. With NumPy
+    the chains and the length of the nearest match are worked out up front
+    for every position (exact_matches), and runs of positions without any
+    match are copied as literals in one go. Without
+    NumPy the chain heads are kept in a table of 2**HASH_BITS entries and the
+    links in a ring of WINDOW_SIZE entries. The level (0-9) sets how many
+    chain entries are examined, how many positions inside matches are added
+    to the chains (without NumPy) and whether a match is deferred when the
+    next position has a longer one. Higher levels compress better and run
+    slower.
+    """
+    max_chain,max_insert,lazy = LEVELS[level]
+    data = bytes(data)
+    size = len(data)
+    out = bytearray(MAGIC + size.to_bytes(4,'big') + bytes(8))
+    bit = 0 #next code bit of the open group, 0 when there is none
+    code_index = 0
+
+    def literals(start,end): #emit data[start:end] as literals, whole groups at a time where possible
+        nonlocal bit,code_index
+        while start < end and bit:
+            out[code_index] |= bit
+            out.append(data[start])
+            start += 1
+            bit >>= 1
+        full = (end - start) >> 3
+        if full:
+            out.extend(b''.join([b'\xFF' + data[i:i + 8] for i in range(start,start + 8*full,8)]))
+            start += 8*full
+        if start < end:
+            code_index = len(out)
+            out.append(0)
+            bit = 0x80
+            while start < end:
+                out[code_index] |= bit
+                out.append(data[start])
+                start += 1
+                bit >>= 1
+
+    if max_chain == 0:
+        literals(0,size)
+        return bytes(out)
+
+    links = None
+    if size >= MIN_MATCH:
+        try:
+            links,nearest,matchable = exact_matches(data)
+        except ImportError:
+            pass
+    if links is None:
+        mask = (1 << HASH_BITS) - 1
+        head = [-1]*(1 << HASH_BITS) #hash -> most recent position
+        ring = [-1]*WINDOW_SIZE #position % WINDOW_SIZE -> previous position with the same hash
+
+    def insert(position):
+        h = ((data[position] << 8) ^ (data[position + 1] << 4) ^ data[position + 2]) & mask
+        ring[position & (WINDOW_SIZE - 1)] = head[h]
+        head[h] = position
+
+    def find(position): #(length,distance) of the longest match found for position, length 0 when there is none
+        limit = min(MAX_MATCH,size - position)
+        if limit < MIN_MATCH: return 0,0
+        low = max(position - WINDOW_SIZE,0)
+        if links is not None: #the nearest match is known already
+            best_length = nearest[position]
+            if not best_length: return 0,0
+            best_distance = position - links[position]
+            if best_length == limit: return best_length,best_distance
+            chain = links
+            candidate = links[position - best_distance]
+            steps = max_chain - 1
+        else:
+            chain = ring
+            candidate = head[((data[position] << 8) ^ (data[position + 1] << 4) ^ data[position + 2]) & mask]
+            best_length = MIN_MATCH - 1
+            best_distance = 0
+            steps = max_chain
+        for _ in range(steps):
+            if candidate < low: break
+            if data[candidate + best_length] == data[position + best_length]: #a longer match has to differ from the best one here
+                length = match_length(data,candidate,position,limit)
+                if length > best_length:
+                    best_length,best_distance = length,position - candidate
+                    if length == limit: break
+            candidate = chain[candidate if chain is links else candidate & (WINDOW_SIZE - 1)]
+        return (best_length,best_distance) if best_distance else (0,0)
+
+    position = 0
+    next_index = 0 #into matchable
+    pending = None #match found at the previous position when lazy matching deferred it
+    while position < size:
+        if links is not None and pending is None and not nearest[position]: #copy the run of positions without a match straight away
+            next_index = bisect_left(matchable,position,next_index)
+            next_position = matchable[next_index] if next_index < len(matchable) else size
+            literals(position,next_position)
+            position = next_position
+            continue
+
+        length,distance = pending if pending is not None else find(position)
+        pending = None
+        if links is None and position + MIN_MATCH <= size: insert(position)
+        if length and lazy and length < MAX_MATCH and position + 1 + MIN_MATCH <= size:
+            next_match = find(position + 1)
+            if next_match[0] > length + 1: #emit a literal now and take the longer match from the next position
+                length = 0
+                pending = next_match
+
+        if not length:
+            literals(position,position + 1)
+            position += 1
+            continue
+        if bit == 0:
+            code_index = len(out)
+            out.append(0)
+            bit = 0x80
+        distance -= 1
+        if length >= 0x12:
+            out += bytes((distance >> 8,distance & 0xFF,length - 0x12))
+        else:
+            out += bytes((((length - 2) << 4) | (distance >> 8),distance & 0xFF))
+        bit >>= 1
+        if links is None and length <= max_insert:
+            for inner in range(position + 1,min(position + length,size - MIN_MATCH + 1)):
+                insert(inner)
+        position += length
+    return bytes(out)
+
+
+class Decoder:
+    """Incremental Yaz0 decoder.
+
+    feed() takes the compressed data in pieces of any size and returns the
+    data decoded so far, keeping only the last WINDOW_SIZE bytes of output
+    for back references, so large files can be decoded from one stream into
+    another in bounded memory.
+    """
+
+    def __init__(self):
+        self.header = b''
+        self.size = None #decompressed size, known once the header is in
+        self.produced = 0
+        self.pending = b'' #compressed input not decoded yet
+        self.history = bytearray() #the last WINDOW_SIZE bytes of output
+
+    @property
+    def finished(self):
+        return self.size is not None and self.produced >= self.size
+
+    def feed(self,data):
+        if self.size is None:
+            self.header += data
+            if len(self.header) < HEADER_SIZE: return b''
+            if not is_compressed(self.header):
+                raise ValueError('not Yaz0 compressed data')
+            self.size = int.from_bytes(self.header[4:8],'big')
+            data = self.header[HEADER_SIZE:]
+            self.header = b''
+        source = self.pending + data if self.pending else bytes(data)
+        out = self.history
+        start = len(out)
+        position = 0
+        end = len(source)
+        remaining = self.size - self.produced
+        while remaining > 0 and position < end:
+            code = source[position]
+            if code == 0xFF and remaining >= 8: #eight literals
+                if position + 9 > end: break
+                out += source[position + 1:position + 9]
+                position += 9
+                remaining -= 8
+                continue
+            if end - position < MAX_GROUP_SIZE: #near the end of the input, only decode the group once all its tokens are in
+                group_end = position + 1
+                bit = 0x80
+                covered = 0
+                while bit and covered < remaining:
+                    if code & bit:
+                        group_end += 1
+                        covered += 1
+                    else:
+                        if group_end + 1 >= end: break
+                        if source[group_end] >> 4:
+                            covered += (source[group_end] >> 4) + 2
+                            group_end += 2
+                        else:
+                            if group_end + 2 >= end: break
+                            covered += source[group_end + 2] + 0x12
+                            group_end += 3
+                    bit >>= 1
+                if group_end > end or (bit and covered < remaining): break
+
+            position += 1
+            for shift in range(7,-1,-1):
+                if code >> shift & 1:
+                    out.append(source[position])
+                    position += 1
+                    remaining -= 1
+                else:
+                    first = source[position]
+                    distance = ((first & 0x0F) << 8 | source[position + 1]) + 1
+                    if first >> 4:
+                        length = (first >> 4) + 2
+                        position += 2
+                    else:
+                        length = source[position + 2] + 0x12
+                        position += 3
+                    if distance > len(out):
+                        raise ValueError('Yaz0 back reference before the start of the data')
+                    copy_start = len(out) - distance
+                    if length <= distance:
+                        out += out[copy_start:copy_start + length]
+                    else: #the copy overlaps its own output, it repeats the last distance bytes
+                        out += (out[copy_start:] * (length//distance + 1))[:length]
+                    remaining -= length
+                if remaining <= 0: break
+        if remaining < 0:
+            raise ValueError('Yaz0 data decodes to more than the size in its header')
+
+        self.pending = source[position:] if remaining > 0 else b''
+        decoded = bytes(out[start:])
+        self.produced += len(decoded)
+        del out[:max(0,len(out) - WINDOW_SIZE)]
+        return decoded
+
+
+def decompress(data):
+    decoder = Decoder()
+    decoded = decoder.feed(data)
+    if not decoder.finished:
+        raise ValueError('truncated Yaz0 data')
+    return decoded
+
+
+def decompress_stream(source,target,chunk_size=1 << 16): #decode from one file object into another, returns the decompressed size
+    decoder = Decoder()
+    while not decoder.finished:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            raise ValueError('truncated Yaz0 data')
+        target.write(decoder.feed(chunk))
+    return decoder.produced
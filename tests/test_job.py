@@ -0,0 +1,135 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import colformat
+from colformat import ExportJob,Triangle,Vertex
+
+
+def stage():
+    """A 3x3 vertex grid with 8 triangles in three collision types, one with ColParameter values."""
+    vertices = [Vertex(x*100.0,(x*y)*12.5 - 3.25,-y*100.0) for y in range(3) for x in range(3)]
+    triangles = []
+    materials = [(0,1,0,None),(7,2,3,None),(258,0,1,300)]
+    for y in range(2):
+        for x in range(2):
+            a = 3*y + x
+            for i,corners in enumerate(((a,a + 3,a + 1),(a + 1,a + 3,a + 4))):
+                triangle = Triangle()
+                triangle.vertex_indices = list(corners)
+                triangle.ColType,triangle.TerrainType,triangle.unknown,triangle.ColParameter = materials[(2*y + x + i) % 3]
+                triangles.append(triangle)
+    return vertices,triangles
+
+
+#stage() packed by the original pack() in BlenderCOL.py
+BASELINE = bytes.fromhex(
+    '00000009000000580000000300000010000000030000ffff000000c4000000f4000000fc00000000000700030000ffff'
+    '000000d6000000f7000000ff00000000010200020001ffff000000e8000000fa000001020000010400000000c0500000'
+    '0000000042c80000c05000000000000043480000c05000000000000000000000c0500000c2c8000042c8000041140000'
+    'c2c800004348000041ae0000c2c8000000000000c0500000c348000042c8000041ae0000c348000043480000423b0000'
+    'c34800000000000300010004000600070004000700050001000300040001000400020005000700080002000400050003'
+    '0006000401010102020200000000000303030101012c012c')
+
+
+class RecordingJob(ExportJob):
+    """ExportJob that records its progress at every checkpoint and can cancel itself part way through writing."""
+
+    write_chunk_size = 16
+
+    def __init__(self,*args,cancel_at=None,**kwargs):
+        super().__init__(*args,**kwargs)
+        self.cancel_at = cancel_at
+        self.fractions = []
+
+    def checkpoint(self,phase_fraction=None):
+        if self.cancel_at is not None and self.phase == 'write' and (phase_fraction or 0) >= self.cancel_at:
+            self.cancel()
+        super().checkpoint(phase_fraction)
+        self.fractions.append(self.progress()[0])
+
+
+class ExportJobTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory,'stage.col')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_pack_matches_baseline(self):
+        stream = io.BytesIO()
+        colformat.pack(stream,*stage())
+        self.assertEqual(stream.getvalue(),BASELINE)
+
+    def test_writer_and_tables_match_baseline(self):
+        vertices,triangles = stage()
+        stream = io.BytesIO()
+        writer = colformat.COLWriter(stream)
+        writer.add_vertices(vertices)
+        writer.add_triangles(triangles)
+        writer.finish()
+        self.assertEqual(stream.getvalue(),BASELINE)
+
+        stream = io.BytesIO()
+        colformat.pack(stream,colformat.VertexTable.from_objects(vertices),colformat.TriangleTable.from_objects(triangles))
+        self.assertEqual(stream.getvalue(),BASELINE)
+
+        stream = io.BytesIO()
+        colformat.pack(stream,*colformat.unpack(io.BytesIO(BASELINE),tables=True))
+        self.assertEqual(stream.getvalue(),BASELINE)
+
+    def test_pack_arrays_matches_baseline(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('needs NumPy')
+        stream = io.BytesIO()
+        colformat.pack_arrays(stream,colformat.unpack_arrays(io.BytesIO(BASELINE)))
+        self.assertEqual(stream.getvalue(),BASELINE)
+
+    def test_round_trip(self):
+        job = ExportJob(self.path,*stage())
+        job.run()
+        self.assertEqual(job.state,'finished')
+        with open(self.path,'rb') as stream:
+            self.assertEqual(stream.read(),BASELINE)
+        with open(self.path,'rb') as stream:
+            vertices,triangles = colformat.unpack(stream)
+        stream = io.BytesIO()
+        colformat.pack(stream,vertices,triangles)
+        self.assertEqual(stream.getvalue(),BASELINE)
+
+    def test_progress_grows_monotonically(self):
+        job = RecordingJob(self.path,*stage(),weld=True,spatial_order='morton')
+        job.run()
+        self.assertEqual(job.state,'finished')
+        self.assertGreater(len(job.fractions),len(job.phases))
+        self.assertEqual(job.fractions,sorted(job.fractions))
+        self.assertEqual(job.progress()[0],1.0)
+
+    def test_cancel_leaves_target_untouched(self):
+        with open(self.path,'wb') as stream:
+            stream.write(b'old file')
+        job = RecordingJob(self.path,*stage(),cancel_at=0.5)
+        job.start()
+        self.assertTrue(job.wait(10))
+        self.assertEqual(job.state,'cancelled')
+        with open(self.path,'rb') as stream:
+            self.assertEqual(stream.read(),b'old file')
+        self.assertEqual(os.listdir(self.directory),['stage.col']) #no temporary file left behind
+
+    def test_failed_validation(self):
+        vertices,triangles = stage()
+        triangles[3].vertex_indices = [0,1,len(vertices)] #points past the last vertex
+        job = ExportJob(self.path,vertices,triangles)
+        job.run()
+        self.assertEqual(job.state,'failed')
+        self.assertTrue(job.error.startswith('Can not export'))
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
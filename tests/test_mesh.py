@@ -0,0 +1,43 @@
+import unittest
+from colformat.mesh import mesh_block
+
+
+def normal(vertices,triangle): #unnormalized COL space normal of a triangle
+    a,b,c = (vertices[index] for index in triangle.vertex_indices)
+    ux,uy,uz = b.x - a.x,b.y - a.y,b.z - a.z
+    vx,vy,vz = c.x - a.x,c.y - a.y,c.z - a.z
+    return (uy*vz - uz*vy,uz*vx - ux*vz,ux*vy - uy*vx)
+
+
+def matrix(x=1.0,y=1.0,z=1.0): #4x4 scale matrix as a sequence of rows, like Object.matrix_world
+    return [[x,0,0,0],[0,y,0,0],[0,0,z,0],[0,0,0,1]]
+
+
+#a floor triangle in blender space, z up and counter clockwise seen from above
+FLOOR = ([0,0,0, 1,0,0, 0,1,0],[0,1,2],[0],[(1,2,3,None)])
+
+
+class MeshBlockTest(unittest.TestCase):
+
+    def floor_normal(self,world_matrix):
+        coordinates,triangle_vertices,material_indices,materials = FLOOR
+        vertices,triangles = mesh_block(coordinates,triangle_vertices,material_indices,materials,world_matrix,1.0)
+        return normal(vertices,triangles[0])
+
+    def test_floor_faces_up(self):
+        self.assertGreater(self.floor_normal(matrix())[1],0)
+
+    def test_mirrored_object_keeps_its_normals(self):
+        self.assertGreater(self.floor_normal(matrix(x=-1))[1],0)
+        self.assertGreater(self.floor_normal(matrix(y=-1))[1],0)
+        self.assertGreater(self.floor_normal(matrix(x=-1,y=-1))[1],0) #a rotation
+        self.assertLess(self.floor_normal(matrix(z=-1))[1],0) #mirrored across the floor, it faces down now
+
+    def test_materials(self):
+        coordinates,triangle_vertices,material_indices,materials = FLOOR
+        _,triangles = mesh_block(coordinates,triangle_vertices,[1],materials,matrix(x=-1),1.0)
+        self.assertEqual((triangles[0].ColType,triangles[0].ColParameter),(0,None)) #slot without a material
+
+
+if __name__ == '__main__':
+    unittest.main()
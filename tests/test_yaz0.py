@@ -0,0 +1,92 @@
+import io
+import random
+import sys
+import unittest
+from unittest import mock
+from colformat import yaz0
+
+
+def samples():
+    rng = random.Random(0)
+    return {
+        'empty':b'',
+        'one byte':b'a',
+        'two bytes':b'ab',
+        'three bytes':b'abc',
+        'repetitive':b'a'*5000 + b'abcabcabd'*700,
+        'incompressible':bytes(rng.randrange(256) for _ in range(5000)),
+        'small alphabet':bytes(rng.randrange(4) for _ in range(20000)),
+        'long matches':(bytes(rng.randrange(256) for _ in range(300)) + b'x')*40,
+    }
+
+
+class Yaz0Test(unittest.TestCase):
+
+    def round_trip(self):
+        for name,data in samples().items():
+            for level in sorted(yaz0.LEVELS):
+                with self.subTest(name,level=level):
+                    compressed = yaz0.compress(data,level)
+                    self.assertTrue(yaz0.is_compressed(compressed))
+                    self.assertEqual(yaz0.decompress(compressed),data)
+
+    def test_round_trip(self):
+        self.round_trip()
+
+    def test_round_trip_without_numpy(self):
+        with mock.patch.dict(sys.modules,{'numpy':None}):
+            self.round_trip()
+
+    def test_compression(self):
+        data = samples()
+        self.assertLess(len(yaz0.compress(data['repetitive'])),len(data['repetitive'])//20)
+        self.assertLessEqual(len(yaz0.compress(data['incompressible'])),yaz0.HEADER_SIZE + len(data['incompressible'])*9//8 + 1)
+
+    def test_byte_by_byte(self):
+        for name,data in samples().items():
+            with self.subTest(name):
+                decoder = yaz0.Decoder()
+                decoded = b''.join(decoder.feed(yaz0.compress(data)[i:i + 1]) for i in range(len(yaz0.compress(data))))
+                self.assertTrue(decoder.finished)
+                self.assertEqual(decoded,data)
+
+    def test_random_chunks(self):
+        rng = random.Random(1)
+        for name,data in samples().items():
+            compressed = yaz0.compress(data,9)
+            with self.subTest(name):
+                decoder = yaz0.Decoder()
+                pieces = []
+                position = 0
+                while position < len(compressed):
+                    size = rng.randrange(1,40)
+                    pieces.append(decoder.feed(compressed[position:position + size]))
+                    position += size
+                self.assertEqual(b''.join(pieces),data)
+
+    def test_decompress_stream(self):
+        data = samples()['small alphabet']
+        target = io.BytesIO()
+        self.assertEqual(yaz0.decompress_stream(io.BytesIO(yaz0.compress(data)),target,chunk_size=100),len(data))
+        self.assertEqual(target.getvalue(),data)
+
+    def test_truncated(self):
+        compressed = yaz0.compress(samples()['small alphabet'])
+        for end in (8,yaz0.HEADER_SIZE,len(compressed)//2,len(compressed) - 1):
+            with self.subTest(end=end):
+                with self.assertRaises(ValueError):
+                    yaz0.decompress_stream(io.BytesIO(compressed[:end]),io.BytesIO())
+                with self.assertRaises(ValueError):
+                    yaz0.decompress(compressed[:end])
+
+    def test_not_yaz0(self):
+        with self.assertRaises(ValueError):
+            yaz0.decompress(b'Yay0' + bytes(12))
+
+    def test_back_reference_before_start(self):
+        with self.assertRaises(ValueError):
+            yaz0.decompress(yaz0.MAGIC + (3).to_bytes(4,'big') + bytes(8) + b'\x00\x10\x05')
+
+
+if __name__ == '__main__':
+    unittest.main()